@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import AuditEvent, StudyEntry, StudyInstruction
+from .models import ApiToken, AuditEvent, IngestRequest, StudyEntry, StudyInstruction
 
 
 @admin.register(StudyEntry)
@@ -26,3 +26,15 @@ class StudyInstructionAdmin(admin.ModelAdmin):
 class AuditEventAdmin(admin.ModelAdmin):
     list_display = ("action", "username", "created_at")
     readonly_fields = ("action", "username", "details", "created_at")
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ("user", "name", "created_at")
+    readonly_fields = ("key_hash", "created_at")
+
+
+@admin.register(IngestRequest)
+class IngestRequestAdmin(admin.ModelAdmin):
+    list_display = ("idempotency_key", "user", "created_at")
+    readonly_fields = ("user", "idempotency_key", "payload_hash", "response", "created_at")
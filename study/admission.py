@@ -0,0 +1,101 @@
+"""Admission control shared by all worker processes on one host.
+
+Expensive views are assigned to a lane. Each lane has a fixed number of
+concurrency slots, implemented as advisory locks on slot files, so a crashed
+worker frees its slot automatically. Per-user request rates are counted in
+fixed windows in a small SQLite file. Both live in ADMISSION_CONTROL_DIR,
+which must be on local disk.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import sqlite3
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from .locks import LockBusyError, advisory_lock
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def admission_lane(lane: str):
+    """Put a function-based view into an admission lane."""
+
+    def decorator(view_func):
+        view_func.admission_lane = lane
+        return view_func
+
+    return decorator
+
+
+def get_admission_lane(view_func, request) -> str | None:
+    """Lane for this request; views may declare a lane name or a callable taking the request."""
+    view_class = getattr(view_func, "view_class", None)
+    lane = getattr(view_class if view_class is not None else view_func, "admission_lane", None)
+    if callable(lane):
+        return lane(request)
+    return lane
+
+
+def _rate_connection(directory: Path) -> sqlite3.Connection:
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(directory)
+    if connection is None:
+        directory.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(directory / "rates.sqlite3", timeout=0.5, isolation_level=None)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS hits "
+            "(bucket TEXT PRIMARY KEY, window_start REAL NOT NULL, count INTEGER NOT NULL)"
+        )
+        connections[directory] = connection
+    return connection
+
+
+def consume_rate(directory: Path, bucket: str, limit: int, per_seconds: float) -> float:
+    """Count one request for ``bucket``; returns 0 if allowed, else seconds until allowed."""
+    now = time.time()
+    window_start = now - now % per_seconds
+    try:
+        connection = _rate_connection(directory)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT window_start, count FROM hits WHERE bucket = ?", (bucket,)
+            ).fetchone()
+            count = row[1] if row is not None and row[0] == window_start else 0
+            if count >= limit:
+                return window_start + per_seconds - now
+            connection.execute(
+                "INSERT OR REPLACE INTO hits (bucket, window_start, count) VALUES (?, ?, ?)",
+                (bucket, window_start, count + 1),
+            )
+        finally:
+            connection.execute("COMMIT")
+    except sqlite3.Error as exc:
+        # Never turn a broken rate store into an outage; admit the request.
+        logger.warning("Rate limit store unavailable: %s", exc)
+    return 0.0
+
+
+def acquire_slot(directory: Path, lane: str, slots: int) -> ExitStack | None:
+    """Hold one of ``slots`` lane slots; returns None when all are taken."""
+    for index in range(slots):
+        stack = ExitStack()
+        try:
+            stack.enter_context(advisory_lock(str(directory / f"{lane}-{index}.slot")))
+        except LockBusyError:
+            continue
+        return stack
+    return None
+
+
+def retry_after_header(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
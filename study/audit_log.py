@@ -0,0 +1,305 @@
+"""Time-segmented JSON-lines audit log files with gzip compaction and a sidecar index.
+
+Records are appended to ``audit-<segment start>.jsonl`` where the segment is picked
+from the record time, so every worker process writes to the same file without any
+rename coordination. Segments that ended more than ``COMPACTION_GRACE_SECONDS`` ago
+are gzipped and summarized in ``index.json`` (time range, users, actions, count),
+which lets queries open only the segments that can contain matches. Compaction
+runs from the ``compact_audit_log`` command, never from a request.
+"""
+
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .locks import LockBusyError, advisory_lock
+
+SEGMENT_PREFIX = "audit-"
+SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%SZ"
+INDEX_NAME = "index.json"
+CLAIMED_SUFFIX = ".compacting"
+COMPACTION_GRACE_SECONDS = 60
+
+logger = logging.getLogger(__name__)
+
+
+def _segment_start(timestamp: float, segment_seconds: int) -> int:
+    return int(timestamp // segment_seconds) * segment_seconds
+
+
+def _segment_name(start: int) -> str:
+    return SEGMENT_PREFIX + datetime.fromtimestamp(start, timezone.utc).strftime(SEGMENT_TIME_FORMAT)
+
+
+def _parse_segment_start(path: Path) -> int | None:
+    stem = path.name.split(".", 1)[0]
+    try:
+        moment = datetime.strptime(stem[len(SEGMENT_PREFIX):], SEGMENT_TIME_FORMAT)
+    except ValueError:
+        return None
+    return int(moment.replace(tzinfo=timezone.utc).timestamp())
+
+
+def read_index(directory: Path) -> list[dict]:
+    try:
+        with (directory / INDEX_NAME).open("r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def _write_index(directory: Path, index: list[dict]) -> None:
+    with tempfile.NamedTemporaryFile(
+        mode="w", encoding="utf-8", suffix=".json", dir=directory, delete=False
+    ) as temp_file:
+        json.dump(index, temp_file)
+    os.replace(temp_file.name, directory / INDEX_NAME)
+
+
+def _iter_lines(path: Path, limit: int | None = None):
+    """Yield the records of a segment file, reading at most ``limit`` raw bytes.
+
+    Torn or undecodable lines (a worker killed mid-write, a truncated gzip member)
+    are skipped and counted instead of failing the whole query or compaction.
+    """
+    skipped = 0
+    with path.open("rb") as raw:
+        stream = io.BytesIO(raw.read(limit)) if limit is not None else raw
+        if path.suffix == ".gz":
+            stream = gzip.GzipFile(fileobj=stream)
+        lines = io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+        try:
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    skipped += 1
+                    continue
+                if not isinstance(record, dict) or "ts" not in record:
+                    skipped += 1
+                    continue
+                yield record
+        except (EOFError, gzip.BadGzipFile):
+            skipped += 1
+    if skipped:
+        logger.warning("Skipped %s undecodable audit line(s) in %s", skipped, path.name)
+
+
+def _summarize_segment(path: Path, start: int, segment_seconds: int) -> dict:
+    users: set[str] = set()
+    actions: set[str] = set()
+    count = 0
+    first = last = None
+    for record in _iter_lines(path):
+        users.add(record.get("user", ""))
+        actions.add(record.get("action", ""))
+        count += 1
+        first = record["ts"] if first is None else min(first, record["ts"])
+        last = record["ts"] if last is None else max(last, record["ts"])
+    return {
+        "file": path.name,
+        "segment_start": start,
+        "segment_end": start + segment_seconds,
+        "first": first,
+        "last": last,
+        "count": count,
+        "users": sorted(users),
+        "actions": sorted(actions),
+    }
+
+
+def _save_index(directory: Path, index: dict[str, dict]) -> None:
+    _write_index(directory, sorted(index.values(), key=lambda segment: segment["segment_start"]))
+
+
+def _claimed_path(directory: Path, gz_name: str) -> Path:
+    return directory / (gz_name[: -len(".gz")] + CLAIMED_SUFFIX)
+
+
+def _compact_segment(
+    directory: Path, index: dict[str, dict], name: str, start: int, segment_seconds: int
+) -> None:
+    """Append the claimed segment ``name`` to its ``.gz`` file; safe to rerun after a crash.
+
+    The index first records the ``.gz`` size before the append (``pending_base_size``),
+    so a rerun truncates a partial or complete earlier append instead of duplicating
+    it. The claimed file is deleted before the pending marker is cleared.
+    """
+    claimed = directory / (name + CLAIMED_SUFFIX)
+    gz_path = directory / (name + ".gz")
+    entry = index.setdefault(
+        gz_path.name,
+        {
+            "file": gz_path.name,
+            "segment_start": start,
+            "segment_end": start + segment_seconds,
+            "first": None,
+            "last": None,
+            "count": 0,
+            "users": [],
+            "actions": [],
+        },
+    )
+    if "pending_base_size" not in entry:
+        entry["pending_base_size"] = gz_path.stat().st_size if gz_path.exists() else 0
+        _save_index(directory, index)
+
+    with gz_path.open("ab") as target:
+        target.truncate(entry["pending_base_size"])
+        with claimed.open("rb") as source, gzip.GzipFile(fileobj=target, mode="ab") as compressed:
+            shutil.copyfileobj(source, compressed)
+        target.flush()
+        os.fsync(target.fileno())
+    claimed.unlink()
+
+    index[gz_path.name] = _summarize_segment(gz_path, start, segment_seconds)
+    _save_index(directory, index)
+
+
+def compact_closed_segments(directory: Path, segment_seconds: int, now: float | None = None) -> int:
+    """Gzip finished segments and add them to the index; returns how many were compacted.
+
+    A closed ``.jsonl`` segment is first renamed to ``.jsonl.compacting``, so late
+    writers start a fresh file instead of appending to one being compacted.
+    """
+    now = time.time() if now is None else now
+    try:
+        with advisory_lock(str(directory / f"{INDEX_NAME}.lock")):
+            index = {segment["file"]: segment for segment in read_index(directory)}
+
+            # An earlier run died after deleting the claimed file: only the summary is missing.
+            for entry in list(index.values()):
+                if "pending_base_size" in entry and not _claimed_path(directory, entry["file"]).exists():
+                    index[entry["file"]] = _summarize_segment(
+                        directory / entry["file"], entry["segment_start"], segment_seconds
+                    )
+                    _save_index(directory, index)
+
+            names = {
+                path.name[: -len(CLAIMED_SUFFIX)]
+                for path in directory.glob(f"{SEGMENT_PREFIX}*{CLAIMED_SUFFIX}")
+            }
+            for path in directory.glob(f"{SEGMENT_PREFIX}*.jsonl"):
+                start = _parse_segment_start(path)
+                if start is not None and start + segment_seconds + COMPACTION_GRACE_SECONDS <= now:
+                    names.add(path.name)
+
+            compacted = 0
+            for name in sorted(names):
+                start = _parse_segment_start(directory / name)
+                if start is None:
+                    continue
+                claimed = directory / (name + CLAIMED_SUFFIX)
+                if not claimed.exists():
+                    os.replace(directory / name, claimed)
+                _compact_segment(directory, index, name, start, segment_seconds)
+                compacted += 1
+            return compacted
+    except LockBusyError:
+        return 0
+
+
+def _iso(value: datetime | None) -> str | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def query_audit_log(
+    directory: Path,
+    segment_seconds: int,
+    user: str | None = None,
+    action: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    """Yield matching records, opening only segments whose index entry can match."""
+    since_ts = since.timestamp() if since else None
+    until_ts = until.timestamp() if until else None
+    since_iso, until_iso = _iso(since), _iso(until)
+
+    candidates: list[tuple[int, Path, int | None]] = []
+    for segment in read_index(directory):
+        if since_ts is not None and segment["segment_end"] <= since_ts:
+            continue
+        if until_ts is not None and segment["segment_start"] >= until_ts:
+            continue
+        limit = None
+        if "pending_base_size" in segment:
+            # Interrupted compaction: its summary is incomplete, and while the claimed
+            # file still exists only the bytes before the append are authoritative.
+            if _claimed_path(directory, segment["file"]).exists():
+                limit = segment["pending_base_size"]
+        else:
+            if user is not None and user not in segment["users"]:
+                continue
+            if action is not None and action not in segment["actions"]:
+                continue
+        candidates.append((segment["segment_start"], directory / segment["file"], limit))
+
+    for pattern in (f"{SEGMENT_PREFIX}*.jsonl", f"{SEGMENT_PREFIX}*{CLAIMED_SUFFIX}"):
+        for path in directory.glob(pattern):
+            start = _parse_segment_start(path)
+            if start is None:
+                continue
+            if since_ts is not None and start + segment_seconds <= since_ts:
+                continue
+            if until_ts is not None and start >= until_ts:
+                continue
+            candidates.append((start, path, None))
+
+    for _, path, limit in sorted(candidates, key=lambda candidate: candidate[:2]):
+        if not path.exists():
+            continue
+        for record in _iter_lines(path, limit):
+            if user is not None and record.get("user") != user:
+                continue
+            if action is not None and record.get("action") != action:
+                continue
+            if since_iso is not None and record["ts"] < since_iso:
+                continue
+            if until_iso is not None and record["ts"] >= until_iso:
+                continue
+            yield record
+
+
+class SegmentedAuditFileHandler(logging.Handler):
+    """Logging handler writing ``study.audit`` records as JSON lines into time segments."""
+
+    def __init__(self, directory, segment_seconds: int = 86400):
+        super().__init__()
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_seconds = int(segment_seconds)
+
+    def _record_payload(self, record: logging.LogRecord) -> dict:
+        audit = getattr(record, "audit", None) or {
+            "action": "", "user": "", "details": record.getMessage()
+        }
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+            timespec="microseconds"
+        )
+        return {"ts": timestamp, **audit}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line = json.dumps(self._record_payload(record), ensure_ascii=False)
+            start = _segment_start(record.created, self.segment_seconds)
+            path = self.directory / f"{_segment_name(start)}.jsonl"
+            with path.open("a", encoding="utf-8") as handle:
+                handle.write(line + "\n")
+        except Exception:
+            self.handleError(record)
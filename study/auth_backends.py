@@ -0,0 +1,87 @@
+"""Authentication backend that caches users per worker process for a short TTL.
+
+Other workers learn about a change through a per-user marker file whose mtime is
+bumped whenever the user is saved or deleted (deactivation, password change, ...).
+Checking it is one ``stat`` call instead of an ``auth_user`` query.
+
+Sessions deleted from the database (logout elsewhere, admin, ``clearsessions``)
+are also evicted from the shared session cache, so they cannot outlive the row.
+"""
+
+from __future__ import annotations
+
+import copy
+import os
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.sessions.backends.cached_db import KEY_PREFIX as SESSION_CACHE_KEY_PREFIX
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+# user_id -> (expires_at, marker_mtime_ns, user), kept per worker process.
+_user_cache: dict[int, tuple[float, int, object]] = {}
+
+
+def _marker_path(user_id) -> Path:
+    return Path(settings.AUTH_CACHE_DIR) / f"user-{user_id}"
+
+
+def _marker_mtime(user_id) -> int:
+    try:
+        return os.stat(_marker_path(user_id)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def invalidate_cached_user(user_id) -> None:
+    _user_cache.pop(user_id, None)
+    marker = _marker_path(user_id)
+    marker.parent.mkdir(parents=True, exist_ok=True)
+    marker.touch()
+    # Make sure the new mtime differs even on filesystems with coarse timestamps.
+    stamp = max(time.time_ns(), _marker_mtime(user_id) + 1)
+    os.utime(marker, ns=(stamp, stamp))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        now = time.monotonic()
+        cached = _user_cache.get(user_id)
+        marker = _marker_mtime(user_id)
+        if cached is not None and cached[0] > now and cached[1] == marker:
+            return copy.copy(cached[2])
+
+        user = super().get_user(user_id)
+        if user is None:
+            _user_cache.pop(user_id, None)
+            return None
+        _user_cache[user_id] = (now + settings.AUTH_USER_CACHE_SECONDS, marker, user)
+        return copy.copy(user)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def _invalidate_on_user_change(sender, instance, update_fields=None, **kwargs):
+    if not settings.CACHED_AUTH:
+        return
+    # Logins only bump last_login; that alone does not need to evict the user.
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_delete, sender=Session)
+def _evict_deleted_session(sender, instance, **kwargs):
+    if settings.SESSION_ENGINE != "django.contrib.sessions.backends.cached_db":
+        return
+    caches[settings.SESSION_CACHE_ALIAS].delete(SESSION_CACHE_KEY_PREFIX + instance.session_key)
@@ -0,0 +1,109 @@
+"""Routing of read-heavy study workloads to configured read replicas."""
+
+from __future__ import annotations
+
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = "replica_"
+PRIMARY_PIN_SESSION_KEY = "db_primary_pinned_until"
+
+# alias -> (checked_at, healthy), kept per worker process.
+_replica_health: dict[str, tuple[float, bool]] = {}
+
+
+def replica_aliases() -> list[str]:
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+def _replica_lag_seconds(alias: str) -> float:
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+    # The last replayed transaction gets older while the primary is idle, so a
+    # replica that has replayed everything it received counts as caught up; but
+    # only while its WAL receiver is streaming, since a disconnected receiver
+    # stops receiving and replay then "catches up" with a stale position.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE "
+            "WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE pid IS NOT NULL "
+            "AND COALESCE(status, 'streaming') = 'streaming') THEN NULL "
+            "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        lag = cursor.fetchone()[0]
+    if lag is None:
+        logger.warning("Read replica %s has no streaming WAL receiver", alias)
+        return float("inf")
+    return float(lag)
+
+
+def _check_replica(alias: str) -> bool:
+    try:
+        connections[alias].ensure_connection()
+        lag = _replica_lag_seconds(alias)
+    except DatabaseError as exc:
+        logger.warning("Read replica %s unavailable: %s", alias, exc)
+        return False
+    if lag > settings.REPLICA_MAX_LAG_SECONDS:
+        logger.warning("Read replica %s lags by %.1f seconds", alias, lag)
+        return False
+    return True
+
+
+def replica_is_healthy(alias: str) -> bool:
+    now = time.monotonic()
+    checked_at, healthy = _replica_health.get(alias, (0.0, False))
+    if alias not in _replica_health or now - checked_at >= settings.REPLICA_HEALTH_CHECK_SECONDS:
+        healthy = _check_replica(alias)
+        _replica_health[alias] = (now, healthy)
+    return healthy
+
+
+def pin_to_primary(request) -> None:
+    """Serve this user's reads from the primary for a while after they write."""
+    if replica_aliases():
+        request.session[PRIMARY_PIN_SESSION_KEY] = time.time() + settings.REPLICA_STICKINESS_SECONDS
+
+
+def read_alias(request=None) -> str:
+    """Pick the database alias for a read-only workload, preferring a healthy replica."""
+    aliases = replica_aliases()
+    if not aliases:
+        return DEFAULT_DB_ALIAS
+    if request is not None and request.session.get(PRIMARY_PIN_SESSION_KEY, 0) > time.time():
+        return DEFAULT_DB_ALIAS
+
+    healthy = [alias for alias in aliases if replica_is_healthy(alias)]
+    if not healthy:
+        return DEFAULT_DB_ALIAS
+    return random.choice(healthy)
+
+
+class ReadReplicaRouter:
+    """Keep writes and migrations on the primary; replicas are only used explicitly."""
+
+    def db_for_read(self, model, **hints):
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Instances loaded from a replica must still be saved to the primary.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db.startswith(REPLICA_PREFIX):
+            return False
+        return None
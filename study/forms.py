@@ -1,6 +1,7 @@
 from datetime import timedelta
 
 from django import forms
+from django.contrib.auth import get_user_model
 from django.utils import timezone
 
 from .models import StudyEntry, StudyInstruction
@@ -39,6 +40,49 @@ class StudyEntryForm(forms.ModelForm):
         return value
 
 
+class StudyEntryBatchForm(StudyEntryForm):
+    """Validates one API batch item; (piz, examination_date) clashes are upserts, not errors."""
+
+    def _get_validation_exclusions(self):
+        # Skips the unique_piz_exam_date check (one query per item) at model level;
+        # form field validation of both fields still runs.
+        return super()._get_validation_exclusions() | {"piz", "examination_date"}
+
+
+class EntryBulkEditForm(forms.Form):
+    liver_ambulance_link = forms.ChoiceField(
+        choices=[("", "Leave unchanged"), ("yes", "Set to yes"), ("no", "Set to no")],
+        required=False,
+    )
+    created_by = forms.ModelChoiceField(
+        queryset=get_user_model().objects.filter(is_active=True).order_by("username"),
+        required=False,
+        label="Reassign to",
+        help_text="New creator, e.g. when the original user has left.",
+    )
+    expected_count = forms.IntegerField(min_value=0, widget=forms.HiddenInput)
+
+    def __init__(self, *args, user, **kwargs):
+        super().__init__(*args, **kwargs)
+        if not user.is_staff:
+            del self.fields["created_by"]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.errors and not self.changes():
+            raise forms.ValidationError("Choose at least one change.")
+        return cleaned_data
+
+    def changes(self) -> dict:
+        changes = {}
+        link = self.cleaned_data.get("liver_ambulance_link")
+        if link:
+            changes["liver_ambulance_link"] = link == "yes"
+        if self.cleaned_data.get("created_by") is not None:
+            changes["created_by"] = self.cleaned_data["created_by"]
+        return changes
+
+
 class StudyInstructionForm(forms.ModelForm):
     class Meta:
         model = StudyInstruction
@@ -0,0 +1,67 @@
+"""Advisory file locks shared by exports, audit log compaction and admission control.
+
+The lock is held on an open file (``flock`` on POSIX, ``msvcrt.locking`` on
+Windows), so it is released automatically when the holding process dies.
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - platform-specific
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:  # pragma: no cover - platform-specific
+    msvcrt = None
+
+
+class LockBusyError(Exception):
+    pass
+
+
+@contextmanager
+def advisory_lock(
+    lock_path: str,
+    blocking: bool = False,
+    error: type[LockBusyError] = LockBusyError,
+    message: str = "Lock is held by another process",
+):
+    """Hold an exclusive lock on ``lock_path``; raises ``error(message)`` if it is busy."""
+    lock_file_path = Path(lock_path)
+    lock_file_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with lock_file_path.open("a+b") as lock_file:
+        if msvcrt is not None and lock_file.tell() == 0:
+            lock_file.write(b"0")
+            lock_file.flush()
+
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            except BlockingIOError as exc:
+                raise error(message) from exc
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            return
+
+        if msvcrt is not None:
+            lock_file.seek(0)
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            except OSError as exc:
+                raise error(message) from exc
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+
+        raise error("Advisory locking is unavailable on this platform")
@@ -0,0 +1,50 @@
+import json
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+
+from study.audit_log import compact_closed_segments, query_audit_log
+
+
+def _parse_moment(value: str):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date or datetime: {value}")
+        moment = datetime(day.year, day.month, day.day)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment
+
+
+class Command(BaseCommand):
+    help = "Print audit log records as JSON lines, opening only segments that can match."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only records of this username.")
+        parser.add_argument("--action", help="Only records with this action.")
+        parser.add_argument("--since", help="Inclusive start date or datetime (UTC if naive).")
+        parser.add_argument("--until", help="Exclusive end date or datetime (UTC if naive).")
+        parser.add_argument(
+            "--compact", action="store_true", help="Compress closed segments before querying."
+        )
+
+    def handle(self, *args, **options):
+        directory = settings.AUDIT_LOG_DIR
+        if options["compact"]:
+            compacted = compact_closed_segments(directory, settings.AUDIT_SEGMENT_SECONDS)
+            self.stderr.write(f"Compacted {compacted} segment(s)")
+
+        records = query_audit_log(
+            directory,
+            settings.AUDIT_SEGMENT_SECONDS,
+            user=options["user"],
+            action=options["action"],
+            since=_parse_moment(options["since"]) if options["since"] else None,
+            until=_parse_moment(options["until"]) if options["until"] else None,
+        )
+        for record in records:
+            self.stdout.write(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,12 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from study.audit_log import compact_closed_segments
+
+
+class Command(BaseCommand):
+    help = "Gzip closed audit log segments and add them to the index (run periodically)."
+
+    def handle(self, *args, **options):
+        compacted = compact_closed_segments(settings.AUDIT_LOG_DIR, settings.AUDIT_SEGMENT_SECONDS)
+        self.stdout.write(f"Compacted {compacted} segment(s)")
@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from study.services import create_api_token
+
+
+class Command(BaseCommand):
+    help = "Create an API token for the batch ingestion endpoint and print it once."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--name", default="", help="Label, e.g. the device gateway host.")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist as exc:
+            raise CommandError(f"Unknown user: {options['username']}") from exc
+        self.stdout.write(create_api_token(user, options["name"]))
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from study.db_router import read_alias
+from study.quality import build_quality_report
+
+
+class Command(BaseCommand):
+    help = "Scan all study entries for suspicious patterns and print a data-quality report."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="Print the full report as JSON.")
+
+    def handle(self, *args, **options):
+        report = build_quality_report(using=read_alias())
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"Scanned {report['row_count']} entries in {report['elapsed_seconds']}s")
+        for check, label in (
+            ("near_duplicate_piz", "Near-duplicate PIZ groups"),
+            ("implausible_measurements", "Implausible LSM/CAP measurements"),
+            ("lsm_monthly_outliers", "LSM outliers within their month"),
+            ("cap_monthly_outliers", "CAP outliers within their month"),
+            ("edit_bursts", "Users with edit bursts"),
+        ):
+            self.stdout.write(f"{label}: {report[check]['count']}")
+            for item in report[check]["items"]:
+                self.stdout.write(f"  {item}")
@@ -0,0 +1,54 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from study.snapshots import SnapshotNotFoundError, SnapshotStore
+
+
+class Command(BaseCommand):
+    help = "List, restore and diff the export snapshots in EXPORT_SNAPSHOT_DIR."
+
+    def add_arguments(self, parser):
+        subcommands = parser.add_subparsers(dest="subcommand", required=True)
+        subcommands.add_parser("list", help="List snapshots with their row and chunk counts.")
+        restore = subcommands.add_parser("restore", help="Write a snapshot back to an XLSX file.")
+        restore.add_argument("snapshot_id")
+        restore.add_argument("target")
+        diff = subcommands.add_parser("diff", help="List entries added, changed or removed.")
+        diff.add_argument("old_id")
+        diff.add_argument("new_id")
+        diff.add_argument("--json", action="store_true", help="Print one JSON object per change.")
+
+    def handle(self, *args, **options):
+        if not settings.EXPORT_SNAPSHOT_DIR:
+            raise CommandError("EXPORT_SNAPSHOT_DIR is not configured.")
+        store = SnapshotStore(settings.EXPORT_SNAPSHOT_DIR)
+        try:
+            getattr(self, f"_{options['subcommand']}")(store, options)
+        except SnapshotNotFoundError as exc:
+            raise CommandError(str(exc)) from exc
+
+    def _list(self, store, options):
+        for manifest in store.list():
+            self.stdout.write(
+                f"{manifest['id']}  {manifest['row_count']} rows  {len(manifest['chunks'])} chunks"
+            )
+
+    def _restore(self, store, options):
+        rows = store.restore(options["snapshot_id"], options["target"])
+        self.stdout.write(f"Restored {rows} rows to {options['target']}")
+
+    def _diff(self, store, options):
+        header = store.load(options["new_id"])["header"]
+        for kind, key, old_row, new_row in store.diff(options["old_id"], options["new_id"]):
+            if options["json"]:
+                change = {"change": kind, "examination_date": key[0], "piz": key[1]}
+                change.update({"old": old_row, "new": new_row})
+                self.stdout.write(json.dumps(change, ensure_ascii=False))
+                continue
+            self.stdout.write(f"{kind:8} {key[1]} {key[0]}")
+            if kind == "changed":
+                for column, old_value, new_value in zip(header, old_row, new_row):
+                    if old_value != new_value:
+                        self.stdout.write(f"         {column}: {old_value!r} -> {new_value!r}")
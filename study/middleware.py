@@ -0,0 +1,130 @@
+import random
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+
+from .admission import acquire_slot, consume_rate, get_admission_lane, retry_after_header
+from .profiling import RequestProfiler, save_profile
+from .query_budget import get_query_budget, logger, record_queries
+
+
+class QueryInspectionMiddleware:
+    """Development aid: warn about repeated identical SQL and exceeded view budgets."""
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_budget = None
+        with record_queries() as recorder:
+            response = self.get_response(request)
+
+        for sql, count in recorder.repeated(settings.QUERY_REPEAT_THRESHOLD):
+            logger.warning("%s %s: query repeated %s times: %s", request.method, request.path, count, sql)
+
+        budget = request.query_budget
+        if budget is not None and len(recorder.statements) > budget:
+            logger.warning(
+                "%s %s: %s queries exceed budget of %s",
+                request.method,
+                request.path,
+                len(recorder.statements),
+                budget,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(view_func)
+        return None
+
+
+class AdmissionControlMiddleware:
+    """Shed load on expensive lanes with fast 429/503 responses instead of queueing."""
+
+    def __init__(self, get_response):
+        if not settings.ADMISSION_CONTROL_DIR:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.directory = Path(settings.ADMISSION_CONTROL_DIR)
+
+    def __call__(self, request):
+        request.admission_slot = None
+        try:
+            return self.get_response(request)
+        finally:
+            if request.admission_slot is not None:
+                request.admission_slot.close()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        lane = get_admission_lane(view_func, request)
+        if lane is None:
+            return None
+        config = settings.ADMISSION_LANES[lane]
+
+        if request.user.is_authenticated:
+            client = f"user:{request.user.pk}"
+        else:
+            client = f"addr:{request.META.get('REMOTE_ADDR', '')}"
+        # Take the slot first so a request shed with 503 does not use up the rate quota.
+        slot = acquire_slot(self.directory, lane, config["slots"])
+        if slot is None:
+            return self._reject(503, "Server busy, please try again shortly.", config["retry_after"])
+
+        wait = consume_rate(self.directory, f"{lane}:{client}", config["rate"], config["per_seconds"])
+        if wait:
+            slot.close()
+            return self._reject(429, "Too many requests, please slow down.", wait)
+        request.admission_slot = slot
+        return None
+
+    def _reject(self, status: int, message: str, retry_after: float) -> HttpResponse:
+        response = HttpResponse(message, status=status, content_type="text/plain")
+        response["Retry-After"] = retry_after_header(retry_after)
+        return response
+
+
+class ProfilingMiddleware:
+    """Profile single requests on demand (staff) or by random sampling, into PROFILE_DIR."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def _trigger(self, request) -> str | None:
+        if request.headers.get("X-Profile") or request.GET.get("_profile"):
+            if request.user.is_staff:
+                return "requested"
+        if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+            return "sampled"
+        return None
+
+    def __call__(self, request):
+        trigger = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        with RequestProfiler(settings.PROFILE_SAMPLE_INTERVAL_MS) as profiler:
+            response = self.get_response(request)
+
+        profile_id = save_profile(
+            Path(settings.PROFILE_DIR),
+            {
+                "method": request.method,
+                "path": request.get_full_path(),
+                "user": request.user.get_username() if request.user.is_authenticated else "",
+                "status": response.status_code,
+                "trigger": trigger,
+                "duration_ms": profiler.duration_ms,
+                "sample_interval_ms": settings.PROFILE_SAMPLE_INTERVAL_MS,
+                "sql": profiler.sql.queries,
+                "stacks": dict(profiler.sampler.stacks),
+            },
+            settings.PROFILE_MAX_FILES,
+        )
+        response["X-Profile-Id"] = profile_id
+        return response
@@ -0,0 +1,155 @@
+"""Per-request profiles: sampled Python stacks plus the SQL issued, stored as JSON files.
+
+A background thread samples the request thread's stack every
+PROFILE_SAMPLE_INTERVAL_MS. The counts are kept as folded stacks
+(``outer;inner;leaf count``), the input format of flamegraph.pl, speedscope
+and similar tools.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import secrets
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.db import connections
+
+
+class ProfileNotFoundError(Exception):
+    pass
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class StackSampler:
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class SqlTimer:
+    def __init__(self):
+        self.queries: list[dict] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = (time.perf_counter() - started) * 1000
+            self.queries.append(
+                {
+                    "alias": context["connection"].alias,
+                    "sql": sql,
+                    "duration_ms": round(duration, 3),
+                }
+            )
+
+
+class RequestProfiler:
+    """Context manager capturing stack samples and SQL for the current thread."""
+
+    def __init__(self, interval_ms: float):
+        self.sampler = StackSampler(threading.get_ident(), interval_ms / 1000)
+        self.sql = SqlTimer()
+        self.duration_ms = 0.0
+
+    def __enter__(self):
+        # Every alias, since list, export and quality views read from replicas.
+        self._sql_wrappers = ExitStack()
+        for db_connection in connections.all():
+            self._sql_wrappers.enter_context(db_connection.execute_wrapper(self.sql))
+        self._started = time.perf_counter()
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.sampler.stop()
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        self._sql_wrappers.__exit__(*exc_info)
+        return False
+
+
+def save_profile(directory: Path, profile: dict, max_files: int) -> str:
+    """Write ``profile`` under a new id and delete the oldest files beyond ``max_files``."""
+    directory.mkdir(parents=True, exist_ok=True)
+    created_at = datetime.now(timezone.utc)
+    profile_id = f"{created_at.strftime('%Y%m%dT%H%M%S%fZ')}-{secrets.token_hex(3)}"
+    profile = {"id": profile_id, "created_at": created_at.isoformat(), **profile}
+
+    with tempfile.NamedTemporaryFile(
+        mode="w", encoding="utf-8", suffix=".tmp", dir=directory, delete=False
+    ) as temp_file:
+        json.dump(profile, temp_file)
+    os.replace(temp_file.name, directory / f"{profile_id}.json")
+
+    for stale in sorted(directory.glob("*.json"))[:-max_files]:
+        stale.unlink(missing_ok=True)
+    return profile_id
+
+
+def list_profiles(directory: Path) -> list[dict]:
+    """Summaries of stored profiles, newest first."""
+    summaries = []
+    for path in sorted(directory.glob("*.json"), reverse=True):
+        try:
+            with path.open("r", encoding="utf-8") as handle:
+                profile = json.load(handle)
+        except (FileNotFoundError, ValueError):
+            continue
+        profile["sql_count"] = len(profile.pop("sql"))
+        profile["sample_count"] = sum(profile.pop("stacks").values())
+        summaries.append(profile)
+    return summaries
+
+
+def load_profile(directory: Path, profile_id: str) -> dict:
+    try:
+        with (directory / f"{profile_id}.json").open("r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (FileNotFoundError, ValueError) as exc:
+        raise ProfileNotFoundError(profile_id) from exc
+
+
+def folded_stacks(profile: dict) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(profile["stacks"].items()))
+
+
+def top_functions(profile: dict, limit: int = 25) -> list[tuple[str, int]]:
+    """Functions by samples in which they were the innermost frame (self time)."""
+    leaves: Counter[str] = Counter()
+    for stack, count in profile["stacks"].items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    return leaves.most_common(limit)
@@ -0,0 +1,170 @@
+"""Dataset-wide data-quality checks over StudyEntry, computed column-wise with NumPy."""
+
+from __future__ import annotations
+
+import time
+
+import numpy as np
+
+from .models import AuditEvent, StudyEntry
+
+# FibroScan measurement ranges; values outside them cannot come from the device.
+LSM_DEVICE_RANGE = (1.5, 75.0)
+CAP_DEVICE_RANGE = (100.0, 400.0)
+# Modified z-score cut-off (Iglewicz and Hoaglin) for per-month outliers.
+OUTLIER_Z = 3.5
+BURST_WINDOW_SECONDS = 10 * 60
+BURST_MIN_EVENTS = 30
+MAX_FINDINGS = 100
+
+
+def _transpose(rows, width: int) -> list[tuple]:
+    rows = list(rows)
+    if not rows:
+        return [()] * width
+    return list(zip(*rows))
+
+
+def _load_entry_columns(using: str) -> dict[str, np.ndarray]:
+    rows = StudyEntry.objects.using(using).values_list(
+        "id", "piz", "examination_date", "fibroscan_lsm_kpa", "fibroscan_cap_dbm"
+    )
+    ids, pizs, dates, lsm, cap = _transpose(rows.iterator(chunk_size=10000), 5)
+    return {
+        "id": np.array(ids, dtype=np.int64),
+        "piz": np.array(pizs, dtype=str),
+        "date": np.array(dates, dtype="datetime64[D]"),
+        "lsm": np.array(lsm, dtype=np.float64),
+        "cap": np.array(cap, dtype=np.float64),
+    }
+
+
+def _normalize_piz(piz: np.ndarray) -> np.ndarray:
+    normalized = np.char.upper(np.char.strip(piz))
+    for separator in (" ", "-", "_", ".", "/"):
+        normalized = np.char.replace(normalized, separator, "")
+    return normalized
+
+
+def find_near_duplicate_piz(piz: np.ndarray) -> list[dict]:
+    """Distinct PIZ spellings that only differ in case, whitespace or separators."""
+    distinct = np.unique(piz)
+    keys, inverse, counts = np.unique(
+        _normalize_piz(distinct), return_inverse=True, return_counts=True
+    )
+    clashing = np.flatnonzero(counts > 1)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return [
+        {
+            "key": str(keys[group]),
+            "variants": distinct[order[starts[group]:starts[group] + counts[group]]].tolist(),
+        }
+        for group in clashing
+    ]
+
+
+def find_implausible_measurements(columns: dict[str, np.ndarray]) -> np.ndarray:
+    lsm, cap = columns["lsm"], columns["cap"]
+    outside_lsm = (lsm < LSM_DEVICE_RANGE[0]) | (lsm > LSM_DEVICE_RANGE[1])
+    outside_cap = (cap < CAP_DEVICE_RANGE[0]) | (cap > CAP_DEVICE_RANGE[1])
+    both_zero = (lsm == 0) & (cap == 0)
+    return np.flatnonzero(outside_lsm | outside_cap | both_zero)
+
+
+def _grouped_median(values: np.ndarray, groups: np.ndarray, group_count: int) -> np.ndarray:
+    """Median of ``values`` per group id in ``groups`` (0..group_count-1), without a loop."""
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    lower = starts + (counts - 1) // 2
+    upper = starts + counts // 2
+    medians = np.full(group_count, np.nan)
+    present = counts > 0
+    medians[present] = (sorted_values[lower[present]] + sorted_values[upper[present]]) / 2
+    return medians
+
+
+def find_monthly_outliers(columns: dict[str, np.ndarray], field: str) -> np.ndarray:
+    """Rows whose value is a robust outlier within its examination month."""
+    values = columns[field]
+    if not values.size:
+        return np.array([], dtype=np.int64)
+    months, groups = np.unique(columns["date"].astype("datetime64[M]"), return_inverse=True)
+    medians = _grouped_median(values, groups, months.size)
+    deviations = np.abs(values - medians[groups])
+    mads = _grouped_median(deviations, groups, months.size)[groups]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = 0.6745 * deviations / mads
+    return np.flatnonzero((mads > 0) & (scores > OUTLIER_Z))
+
+
+def find_edit_bursts(using: str) -> list[dict]:
+    """Users with at least BURST_MIN_EVENTS entry writes inside BURST_WINDOW_SECONDS."""
+    events = AuditEvent.objects.using(using).filter(
+        action__in=["entry_create", "entry_update"]
+    ).values_list("username", "created_at")
+    usernames, created = _transpose(events.iterator(chunk_size=10000), 2)
+    if not usernames:
+        return []
+
+    users, user_ids = np.unique(np.array(usernames, dtype=str), return_inverse=True)
+    seconds = np.array([moment.timestamp() for moment in created], dtype=np.float64)
+    seconds -= seconds.min()
+    # Shift every user onto a disjoint time range so one searchsorted covers all users.
+    stride = seconds.max() + BURST_WINDOW_SECONDS + 1
+    keyed = np.sort(user_ids * stride + seconds)
+    in_window = np.searchsorted(keyed, keyed + BURST_WINDOW_SECONDS, side="right") - np.arange(
+        keyed.size
+    )
+    burst_users = (keyed // stride).astype(np.int64)
+    peak = np.zeros(users.size, dtype=np.int64)
+    np.maximum.at(peak, burst_users, in_window)
+    return [
+        {"username": str(users[user]), "max_events_in_window": int(peak[user])}
+        for user in np.flatnonzero(peak >= BURST_MIN_EVENTS)
+    ]
+
+
+def _describe_rows(columns: dict[str, np.ndarray], rows: np.ndarray) -> list[dict]:
+    return [
+        {
+            "id": int(columns["id"][row]),
+            "piz": str(columns["piz"][row]),
+            "examination_date": str(columns["date"][row]),
+            "lsm_kpa": float(columns["lsm"][row]),
+            "cap_dbm": float(columns["cap"][row]),
+        }
+        for row in rows[:MAX_FINDINGS]
+    ]
+
+
+def build_quality_report(using: str = "default") -> dict:
+    started = time.perf_counter()
+    columns = _load_entry_columns(using)
+
+    near_duplicates = find_near_duplicate_piz(columns["piz"])
+    implausible = find_implausible_measurements(columns)
+    lsm_outliers = find_monthly_outliers(columns, "lsm")
+    cap_outliers = find_monthly_outliers(columns, "cap")
+    bursts = find_edit_bursts(using)
+
+    return {
+        "row_count": int(columns["id"].size),
+        "near_duplicate_piz": {"count": len(near_duplicates), "items": near_duplicates[:MAX_FINDINGS]},
+        "implausible_measurements": {
+            "count": int(implausible.size),
+            "items": _describe_rows(columns, implausible),
+        },
+        "lsm_monthly_outliers": {
+            "count": int(lsm_outliers.size),
+            "items": _describe_rows(columns, lsm_outliers),
+        },
+        "cap_monthly_outliers": {
+            "count": int(cap_outliers.size),
+            "items": _describe_rows(columns, cap_outliers),
+        },
+        "edit_bursts": {"count": len(bursts), "items": bursts[:MAX_FINDINGS]},
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
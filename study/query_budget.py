@@ -0,0 +1,51 @@
+"""Per-view query ceilings and detection of repeated SQL within one request."""
+
+from __future__ import annotations
+
+import logging
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+logger = logging.getLogger("study.queries")
+
+
+def query_budget(limit: int):
+    """Declare the maximum number of SQL queries a function-based view may issue."""
+
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+
+    return decorator
+
+
+def get_query_budget(view_func) -> int | None:
+    view_class = getattr(view_func, "view_class", None)
+    if view_class is not None:
+        return getattr(view_class, "query_budget", None)
+    return getattr(view_func, "query_budget", None)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.statements: list[str] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        counts = Counter(self.statements)
+        return [(sql, count) for sql, count in counts.most_common() if count >= threshold]
+
+
+@contextmanager
+def record_queries():
+    """Record the SQL of every database alias, replicas included."""
+    recorder = QueryRecorder()
+    with ExitStack() as stack:
+        for db_connection in connections.all():
+            stack.enter_context(db_connection.execute_wrapper(recorder))
+        yield recorder
@@ -1,122 +1,557 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import logging
 import os
+import secrets
 import tempfile
-from contextlib import contextmanager
+import threading
+import time
 from pathlib import Path
 
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from openpyxl import Workbook
 
-from .models import AuditEvent, StudyEntry
+from .forms import StudyEntryBatchForm
+from .locks import LockBusyError, advisory_lock
+from .models import ApiToken, AuditEvent, IngestRequest, StudyEntry
+from .snapshots import SnapshotStore
 
 
 audit_logger = logging.getLogger("study.audit")
+logger = logging.getLogger(__name__)
 
-try:
-    import fcntl
-except ImportError:  # pragma: no cover - platform-specific
-    fcntl = None
+REPLICATION_CHUNK_SIZE = 1024 * 1024
+ACTIVE_REPLICATION_STATES = {"pending", "replicating", "retrying"}
 
-try:
-    import msvcrt
-except ImportError:  # pragma: no cover - platform-specific
-    msvcrt = None
+
+class ExportLockError(LockBusyError):
+    pass
 
 
-class ExportLockError(Exception):
+class IngestConflictError(Exception):
     pass
 
 
-@contextmanager
-def advisory_export_lock(lock_path: str):
-    lock_file_path = Path(lock_path)
-    lock_file_path.parent.mkdir(parents=True, exist_ok=True)
-
-    with lock_file_path.open("a+b") as lock_file:
-        if msvcrt is not None and lock_file.tell() == 0:
-            lock_file.write(b"0")
-            lock_file.flush()
-
-        if fcntl is not None:
-            try:
-                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-            except BlockingIOError as exc:
-                raise ExportLockError("Export in progress, try again later") from exc
-            try:
-                yield
-            finally:
-                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
-            return
+class BulkEditConflictError(Exception):
+    pass
+
+
+def advisory_export_lock(lock_path: str, blocking: bool = False):
+    return advisory_lock(
+        lock_path, blocking, error=ExportLockError, message="Export in progress, try again later"
+    )
 
-        if msvcrt is not None:
-            lock_file.seek(0)
-            try:
-                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
-            except OSError as exc:
-                raise ExportLockError("Export in progress, try again later") from exc
-            try:
-                yield
-            finally:
-                lock_file.seek(0)
-                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
-            return
 
-        raise ExportLockError("Export locking is unavailable on this platform")
+def can_edit_entry(user, entry) -> bool:
+    return user.is_staff or entry.created_by_id == user.id
+
+
+def editable_entries(user, queryset):
+    """Restrict ``queryset`` to the entries ``user`` may edit (see can_edit_entry)."""
+    if user.is_staff:
+        return queryset
+    return queryset.filter(created_by=user)
 
 
 def write_audit_event(action: str, username: str, details: str = "") -> None:
     AuditEvent.objects.create(action=action, username=username, details=details)
-    audit_logger.info("action=%s user=%s details=%s", action, username, details)
+    audit_logger.info(
+        "action=%s user=%s details=%s",
+        action,
+        username,
+        details,
+        extra={"audit": {"action": action, "user": username, "details": details}},
+    )
+
+
+EXPORT_HEADER = [
+    "PIZ",
+    "Examination Date",
+    "Liver Ambulance Link",
+    "Fibroscan LSM kPa",
+    "Fibroscan CAP dBm",
+    "Created At",
+    "Updated At",
+    "Created By",
+    "Updated By",
+]
+
+
+def _export_rows(using: str):
+    entries = StudyEntry.objects.using(using).select_related("created_by", "updated_by")
+    for entry in entries.order_by("examination_date", "piz").iterator(chunk_size=2000):
+        yield [
+            entry.piz,
+            entry.examination_date.isoformat(),
+            "yes" if entry.liver_ambulance_link else "no",
+            float(entry.fibroscan_lsm_kpa),
+            float(entry.fibroscan_cap_dbm),
+            entry.created_at.isoformat(),
+            entry.updated_at.isoformat(),
+            entry.created_by.username if entry.created_by else "",
+            entry.updated_by.username if entry.updated_by else "",
+        ]
 
 
-def export_entries_to_excel() -> str:
+def _build_export_workbook(rows) -> Workbook:
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "StudyData"
+    sheet.append(EXPORT_HEADER)
+    for row in rows:
+        sheet.append(row)
+    return workbook
+
+
+def _snapshot_rows(using: str):
+    """Rows for one export; kept in memory when they are also recorded as a snapshot."""
+    rows = _export_rows(using)
+    return list(rows) if settings.EXPORT_SNAPSHOT_DIR else rows
+
+
+def _record_export_snapshot(rows) -> None:
+    # Called after the workbook was saved and outside the export lock, so a failed
+    # export leaves no snapshot and the store is not written while others wait.
+    if settings.EXPORT_SNAPSHOT_DIR:
+        SnapshotStore(settings.EXPORT_SNAPSHOT_DIR).record(EXPORT_HEADER, rows)
+
+
+def _save_workbook_atomically(workbook: Workbook, target: Path) -> None:
+    with tempfile.NamedTemporaryFile(
+        mode="wb", suffix=".xlsx", dir=target.parent, delete=False
+    ) as temp_file:
+        temp_path = Path(temp_file.name)
+
+    workbook.save(temp_path)
+    os.replace(temp_path, target)
+
+
+def export_entries_to_excel(using: str = "default") -> str:
+    if settings.EXPORT_STAGING_DIR:
+        return _export_entries_via_staging(using)
+
     target = Path(settings.DATA_XLSX_PATH)
     target.parent.mkdir(parents=True, exist_ok=True)
 
     lock_path = target.with_suffix(target.suffix + ".lock")
     with advisory_export_lock(str(lock_path)):
-        workbook = Workbook()
-        sheet = workbook.active
-        sheet.title = "StudyData"
-        sheet.append(
-            [
-                "PIZ",
-                "Examination Date",
-                "Liver Ambulance Link",
-                "Fibroscan LSM kPa",
-                "Fibroscan CAP dBm",
-                "Created At",
-                "Updated At",
-                "Created By",
-                "Updated By",
-            ]
-        )
+        rows = _snapshot_rows(using)
+        _save_workbook_atomically(_build_export_workbook(rows), target)
 
-        for entry in StudyEntry.objects.select_related("created_by", "updated_by").order_by(
-            "examination_date", "piz"
-        ):
-            sheet.append(
-                [
-                    entry.piz,
-                    entry.examination_date.isoformat(),
-                    "yes" if entry.liver_ambulance_link else "no",
-                    float(entry.fibroscan_lsm_kpa),
-                    float(entry.fibroscan_cap_dbm),
-                    entry.created_at.isoformat(),
-                    entry.updated_at.isoformat(),
-                    entry.created_by.username if entry.created_by else "",
-                    entry.updated_by.username if entry.updated_by else "",
-                ]
+    _record_export_snapshot(rows)
+    return str(target)
+
+
+def _export_entries_via_staging(using: str) -> str:
+    """Build the export on local disk and replicate it to the share in the background."""
+    target = Path(settings.DATA_XLSX_PATH)
+    staged = Path(settings.EXPORT_STAGING_DIR) / target.name
+    staged.parent.mkdir(parents=True, exist_ok=True)
+
+    lock_path = staged.with_suffix(staged.suffix + ".lock")
+    with advisory_export_lock(str(lock_path)):
+        rows = _snapshot_rows(using)
+        _save_workbook_atomically(_build_export_workbook(rows), staged)
+        built_at = timezone.now().isoformat()
+        with _replication_status_lock():
+            _write_replication_status(
+                {
+                    "state": "pending",
+                    "source": str(staged),
+                    "target": str(target),
+                    "built_at": built_at,
+                    "replicated_at": None,
+                    "attempts": 0,
+                    "last_error": "",
+                    "checksum": "",
+                    "pid": os.getpid(),
+                }
             )
 
-        with tempfile.NamedTemporaryFile(
-            mode="wb", suffix=".xlsx", dir=target.parent, delete=False
-        ) as temp_file:
-            temp_path = Path(temp_file.name)
+    _record_export_snapshot(rows)
+    schedule_export_replication(str(staged), str(target), built_at)
+    return str(staged)
+
+
+def _replication_status_path() -> Path:
+    target = Path(settings.DATA_XLSX_PATH)
+    return Path(settings.EXPORT_STAGING_DIR) / f"{target.name}.replication.json"
+
+
+def _replication_status_lock():
+    """Serializes status read-modify-writes across threads and worker processes."""
+    status_path = _replication_status_path()
+    return advisory_export_lock(str(status_path.with_suffix(".lock")), blocking=True)
+
+
+def _read_raw_replication_status() -> dict:
+    try:
+        with _replication_status_path().open("r", encoding="utf-8") as handle:
+            return json.load(handle)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_replication_status(status: dict) -> None:
+    status_path = _replication_status_path()
+    with tempfile.NamedTemporaryFile(
+        mode="w", encoding="utf-8", suffix=".json", dir=status_path.parent, delete=False
+    ) as temp_file:
+        json.dump(status, temp_file)
+    os.replace(temp_file.name, status_path)
+
+
+def _update_replication_status(built_at: str, **fields) -> bool:
+    """Merge ``fields`` into the status unless a newer export has superseded ``built_at``."""
+    with _replication_status_lock():
+        status = _read_raw_replication_status()
+        if status.get("built_at") != built_at:
+            return False
+        status.update(fields)
+        _write_replication_status(status)
+        return True
+
+
+def _process_alive(pid) -> bool:
+    if not pid or os.name == "nt":
+        # os.kill() would terminate the process on Windows; assume it is alive.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _resume_orphaned_replication() -> None:
+    """Restart a replication whose worker process died before finishing it.
+
+    The staging directory is local, so the recorded pid belongs to this host.
+    Taking over happens under the status lock, so only one caller resumes it.
+    """
+    with _replication_status_lock():
+        status = _read_raw_replication_status()
+        if status.get("state") not in ACTIVE_REPLICATION_STATES or _process_alive(status.get("pid")):
+            return
+        logger.warning("Resuming export replication orphaned by process %s", status.get("pid"))
+        status.update(state="pending", pid=os.getpid())
+        _write_replication_status(status)
+    schedule_export_replication(status["source"], status["target"], status["built_at"])
+
+
+def get_export_replication_status() -> dict:
+    if not settings.EXPORT_STAGING_DIR:
+        return {"state": "disabled"}
+
+    _resume_orphaned_replication()
+    status = _read_raw_replication_status()
+    if not status:
+        return {"state": "idle"}
 
-        workbook.save(temp_path)
+    built_at = parse_datetime(status["built_at"])
+    replicated_at = parse_datetime(status["replicated_at"]) if status.get("replicated_at") else None
+    status["lag_seconds"] = ((replicated_at or timezone.now()) - built_at).total_seconds()
+    return status
+
+
+def _sha256_of(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(REPLICATION_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _copy_with_checksum(source: Path, target: Path) -> str:
+    """Copy ``source`` next to ``target``, verify the copy, then atomically rename it."""
+    with tempfile.NamedTemporaryFile(
+        mode="wb", suffix=".xlsx", dir=target.parent, delete=False
+    ) as temp_file:
+        temp_path = Path(temp_file.name)
+
+    try:
+        digest = hashlib.sha256()
+        with source.open("rb") as source_file, temp_path.open("wb") as temp_file:
+            for chunk in iter(lambda: source_file.read(REPLICATION_CHUNK_SIZE), b""):
+                digest.update(chunk)
+                temp_file.write(chunk)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+
+        expected = digest.hexdigest()
+        actual = _sha256_of(temp_path)
+        if actual != expected:
+            raise OSError(f"Checksum mismatch after copy: expected {expected}, got {actual}")
         os.replace(temp_path, target)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    return expected
 
-    return str(target)
+
+def replicate_export(source: str, target: str, built_at: str) -> bool:
+    """Copy a staged export to the network share, retrying with exponential backoff."""
+    source_path = Path(source)
+    target_path = Path(target)
+    lock_path = target_path.with_suffix(target_path.suffix + ".lock")
+    delay = settings.EXPORT_REPLICATION_BACKOFF_SECONDS
+    retries = max(1, settings.EXPORT_REPLICATION_RETRIES)
+
+    for attempt in range(1, retries + 1):
+        if not _update_replication_status(
+            built_at, state="replicating", attempts=attempt, pid=os.getpid()
+        ):
+            return False
+        try:
+            target_path.parent.mkdir(parents=True, exist_ok=True)
+            with advisory_export_lock(str(lock_path)):
+                checksum = _copy_with_checksum(source_path, target_path)
+        except (OSError, ExportLockError) as exc:
+            logger.warning("Export replication attempt %s to %s failed: %s", attempt, target, exc)
+            last_state = "failed" if attempt == retries else "retrying"
+            if not _update_replication_status(built_at, state=last_state, last_error=str(exc)):
+                return False
+            if attempt < retries:
+                time.sleep(delay)
+                delay *= 2
+            continue
+
+        _update_replication_status(
+            built_at,
+            state="replicated",
+            replicated_at=timezone.now().isoformat(),
+            last_error="",
+            checksum=checksum,
+        )
+        return True
+    return False
+
+
+def schedule_export_replication(source: str, target: str, built_at: str) -> threading.Thread:
+    thread = threading.Thread(
+        target=replicate_export,
+        args=(source, target, built_at),
+        name="export-replication",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+
+def _hash_api_key(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def create_api_token(user, name: str = "") -> str:
+    """Create a token for ``user`` and return the raw key; only its hash is stored."""
+    key = secrets.token_urlsafe(32)
+    ApiToken.objects.create(user=user, name=name, key_hash=_hash_api_key(key))
+    return key
+
+
+def user_for_api_token(authorization: str):
+    scheme, _, key = authorization.partition(" ")
+    if scheme.lower() != "token" or not key.strip():
+        return None
+    token = (
+        ApiToken.objects.select_related("user")
+        .filter(key_hash=_hash_api_key(key.strip()))
+        .first()
+    )
+    if token is None or not token.user.is_active:
+        return None
+    return token.user
+
+
+def _validate_batch(items: list) -> tuple[list[dict], list[tuple[int, dict]]]:
+    results: list[dict] = []
+    valid: list[tuple[int, dict]] = []
+    seen: dict[tuple, int] = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results.append(
+                {"index": index, "status": "invalid", "errors": {"__all__": ["Entry must be an object."]}}
+            )
+            continue
+        form = StudyEntryBatchForm(data=item)
+        if not form.is_valid():
+            errors = {field: list(messages) for field, messages in form.errors.items()}
+            results.append({"index": index, "status": "invalid", "errors": errors})
+            continue
+        pair = (form.cleaned_data["piz"], form.cleaned_data["examination_date"])
+        if pair in seen:
+            errors = {"__all__": [f"Duplicate of item {seen[pair]} in this batch."]}
+            results.append({"index": index, "status": "invalid", "errors": errors})
+            continue
+        seen[pair] = index
+        results.append({"index": index})
+        valid.append((index, form.cleaned_data))
+    return results, valid
+
+
+ENTRY_VALUE_FIELDS = ["liver_ambulance_link", "fibroscan_lsm_kpa", "fibroscan_cap_dbm"]
+
+
+def _forbid(result: dict) -> None:
+    result["status"] = "forbidden"
+    result["errors"] = {"__all__": ["You are not allowed to edit this entry."]}
+
+
+def _upsert_entries(valid: list[tuple[int, dict]], user, results: list[dict]) -> None:
+    """Insert new entries and update the existing ones ``user`` may edit.
+
+    Existing rows are locked before the edit check, so their creator cannot change
+    before the update. New rows are inserted without overwriting anything: if
+    another user inserted the same (PIZ, date) in the meantime, that row wins and
+    the item goes through the edit check like any existing entry.
+    """
+    pizs = {data["piz"] for _, data in valid}
+    dates = {data["examination_date"] for _, data in valid}
+    pairs = {(data["piz"], data["examination_date"]) for _, data in valid}
+    existing = {
+        (entry.piz, entry.examination_date): entry
+        for entry in StudyEntry.objects.select_for_update()
+        .filter(piz__in=pizs, examination_date__in=dates)
+        .only("piz", "examination_date", "created_by")
+    }
+
+    new_items: list[tuple[int, dict]] = []
+    update_items: list[tuple[int, dict]] = []
+    for index, data in valid:
+        entry = existing.get((data["piz"], data["examination_date"]))
+        if entry is None:
+            new_items.append((index, data))
+        elif can_edit_entry(user, entry):
+            update_items.append((index, data))
+        else:
+            _forbid(results[index])
+
+    if new_items:
+        StudyEntry.objects.bulk_create(
+            [StudyEntry(**data, created_by=user, updated_by=user) for _, data in new_items],
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+    if update_items:
+        StudyEntry.objects.bulk_create(
+            [StudyEntry(**data, created_by=user, updated_by=user) for _, data in update_items],
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=["piz", "examination_date"],
+            update_fields=[*ENTRY_VALUE_FIELDS, "updated_at", "updated_by"],
+        )
+    if not new_items and not update_items:
+        return
+
+    stored = {
+        (entry.piz, entry.examination_date): entry
+        for entry in StudyEntry.objects.filter(piz__in=pizs, examination_date__in=dates).only(
+            "piz", "examination_date", "created_by"
+        )
+        if (entry.piz, entry.examination_date) in pairs
+    }
+    for index, data in update_items:
+        results[index].update(status="updated", id=stored[(data["piz"], data["examination_date"])].pk)
+    for index, data in new_items:
+        entry = stored[(data["piz"], data["examination_date"])]
+        if entry.created_by_id == user.pk:
+            results[index].update(status="created", id=entry.pk)
+        elif can_edit_entry(user, entry):
+            # Lost an insert race against a row this user may edit; apply the values.
+            StudyEntry.objects.filter(pk=entry.pk).update(
+                **{field: data[field] for field in ENTRY_VALUE_FIELDS},
+                updated_at=timezone.now(),
+                updated_by=user,
+            )
+            results[index].update(status="updated", id=entry.pk)
+        else:
+            _forbid(results[index])
+
+
+def _stored_ingest_response(user, idempotency_key: str, payload_hash: str) -> dict | None:
+    previous = IngestRequest.objects.filter(user=user, idempotency_key=idempotency_key).first()
+    if previous is None:
+        return None
+    if previous.payload_hash != payload_hash:
+        raise IngestConflictError("Idempotency key was already used with a different payload.")
+    return previous.response
+
+
+def ingest_entries(items: list, user, idempotency_key: str = "", payload_hash: str = "") -> dict:
+    """Validate and upsert a batch of entries; replays the stored result for a known key."""
+    if idempotency_key:
+        stored = _stored_ingest_response(user, idempotency_key, payload_hash)
+        if stored is not None:
+            return stored
+
+    results, valid = _validate_batch(items)
+    try:
+        with transaction.atomic():
+            if valid:
+                _upsert_entries(valid, user, results)
+            response = {
+                "created": sum(1 for result in results if result["status"] == "created"),
+                "updated": sum(1 for result in results if result["status"] == "updated"),
+                "invalid": sum(1 for result in results if result["status"] == "invalid"),
+                "forbidden": sum(1 for result in results if result["status"] == "forbidden"),
+                "results": results,
+            }
+            if idempotency_key:
+                IngestRequest.objects.create(
+                    user=user,
+                    idempotency_key=idempotency_key,
+                    payload_hash=payload_hash,
+                    response=response,
+                )
+            write_audit_event(
+                "entry_ingest",
+                user.username,
+                f"key={idempotency_key} created={response['created']} "
+                f"updated={response['updated']} invalid={response['invalid']} "
+                f"forbidden={response['forbidden']}",
+            )
+    except IntegrityError:
+        # A concurrent retry with the same key committed first; serve its result.
+        if idempotency_key:
+            stored = _stored_ingest_response(user, idempotency_key, payload_hash)
+            if stored is not None:
+                return stored
+        raise
+    return response
+
+
+def bulk_update_entries(queryset, changes: dict, user, expected_count: int) -> list[int]:
+    """Apply ``changes`` to every entry in ``queryset`` with one UPDATE and one audit event.
+
+    Raises BulkEditConflictError, without changing anything, if the selection no longer
+    has the ``expected_count`` entries the user previewed.
+    """
+    with transaction.atomic():
+        entry_ids = list(queryset.select_for_update().order_by("id").values_list("id", flat=True))
+        if len(entry_ids) != expected_count:
+            raise BulkEditConflictError(
+                f"The selection now contains {len(entry_ids)} entries instead of "
+                f"{expected_count}. Review the preview and try again."
+            )
+        if not entry_ids:
+            return entry_ids
+
+        StudyEntry.objects.filter(id__in=entry_ids).update(
+            **changes, updated_at=timezone.now(), updated_by=user
+        )
+        described = " ".join(
+            f"{field}={getattr(value, 'pk', value)}" for field, value in sorted(changes.items())
+        )
+        write_audit_event(
+            "entry_bulk_update",
+            user.username,
+            f"{described} entry_ids={','.join(str(entry_id) for entry_id in entry_ids)}",
+        )
+    return entry_ids
@@ -0,0 +1,157 @@
+"""Content-addressed, row-chunked snapshots of every Excel export.
+
+Rows are stored exactly in export order: by examination date, then by PIZ in the
+database's collation, so a restore reproduces the export. (date, PIZ) is also the
+unique key. A row closes a chunk when the CRC of its key hits ``CHUNK_ROWS``, so
+chunk boundaries depend only on the rows around them: an edit or insert changes
+one chunk and all other chunks are shared with earlier snapshots. Chunks are
+gzipped JSON lines stored under ``objects/`` by the SHA-256 of their content;
+each snapshot is a small manifest listing its chunks in order.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+
+from openpyxl import Workbook
+
+CHUNK_ROWS = 512
+MAX_CHUNK_ROWS = 4 * CHUNK_ROWS
+
+
+class SnapshotNotFoundError(Exception):
+    pass
+
+
+def _row_key(row: list) -> tuple:
+    # Export columns: PIZ, Examination Date, ...
+    return (row[1], row[0])
+
+
+def _python_ordered(rows):
+    """Re-sort PIZs within each examination date into Python order for merging.
+
+    Dates sort the same everywhere, but the database collation may order PIZs
+    differently from Python string comparison.
+    """
+    for _, same_date in itertools.groupby(rows, key=lambda row: row[1]):
+        yield from sorted(same_date, key=_row_key)
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(mode="wb", dir=path.parent, delete=False) as temp_file:
+        temp_file.write(data)
+    os.replace(temp_file.name, path)
+
+
+class SnapshotStore:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def _object_path(self, digest: str) -> Path:
+        return self.directory / "objects" / digest[:2] / digest
+
+    def _manifest_path(self, snapshot_id: str) -> Path:
+        return self.directory / "manifests" / f"{snapshot_id}.json"
+
+    def _store_chunk(self, lines: list[bytes]) -> str:
+        content = b"".join(lines)
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._object_path(digest)
+        if not path.exists():
+            _atomic_write(path, gzip.compress(content))
+        return digest
+
+    def record(self, header: list, rows) -> dict:
+        """Store ``rows`` (in export order) and return the new manifest."""
+        chunks: list[str] = []
+        pending: list[bytes] = []
+        row_count = 0
+        for row in rows:
+            pending.append(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n")
+            row_count += 1
+            key = "\x1f".join(str(part) for part in _row_key(row)).encode("utf-8")
+            if zlib.crc32(key) % CHUNK_ROWS == 0 or len(pending) >= MAX_CHUNK_ROWS:
+                chunks.append(self._store_chunk(pending))
+                pending = []
+        if pending:
+            chunks.append(self._store_chunk(pending))
+
+        created_at = datetime.now(timezone.utc)
+        manifest = {
+            "id": created_at.strftime("%Y%m%dT%H%M%S%fZ"),
+            "created_at": created_at.isoformat(),
+            "row_count": row_count,
+            "header": header,
+            "chunks": chunks,
+        }
+        _atomic_write(self._manifest_path(manifest["id"]), json.dumps(manifest).encode("utf-8"))
+        return manifest
+
+    def list(self) -> list[dict]:
+        manifests = []
+        for path in sorted((self.directory / "manifests").glob("*.json")):
+            with path.open("r", encoding="utf-8") as handle:
+                manifests.append(json.load(handle))
+        return manifests
+
+    def load(self, snapshot_id: str) -> dict:
+        try:
+            with self._manifest_path(snapshot_id).open("r", encoding="utf-8") as handle:
+                return json.load(handle)
+        except FileNotFoundError as exc:
+            raise SnapshotNotFoundError(f"Unknown snapshot: {snapshot_id}") from exc
+
+    def _iter_chunk(self, digest: str):
+        with gzip.open(self._object_path(digest), "rt", encoding="utf-8") as handle:
+            for line in handle:
+                yield json.loads(line)
+
+    def iter_rows(self, manifest: dict, skip_chunks: frozenset = frozenset()):
+        for digest in manifest["chunks"]:
+            if digest not in skip_chunks:
+                yield from self._iter_chunk(digest)
+
+    def restore(self, snapshot_id: str, target) -> int:
+        manifest = self.load(snapshot_id)
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("StudyData")
+        sheet.append(manifest["header"])
+        for row in self.iter_rows(manifest):
+            sheet.append(row)
+        workbook.save(target)
+        return manifest["row_count"]
+
+    def diff(self, old_id: str, new_id: str):
+        """Yield ``(kind, key, old_row, new_row)`` with kind ``added``/``removed``/``changed``.
+
+        Chunks present in both snapshots hold identical rows, so they are skipped;
+        the remaining rows are merged as two streams sorted by ``_row_key``.
+        """
+        old, new = self.load(old_id), self.load(new_id)
+        shared = frozenset(old["chunks"]) & frozenset(new["chunks"])
+        old_rows = _python_ordered(self.iter_rows(old, shared))
+        new_rows = _python_ordered(self.iter_rows(new, shared))
+        old_row, new_row = next(old_rows, None), next(new_rows, None)
+        while old_row is not None or new_row is not None:
+            old_key = _row_key(old_row) if old_row is not None else None
+            new_key = _row_key(new_row) if new_row is not None else None
+            if new_row is None or (old_row is not None and old_key < new_key):
+                yield ("removed", old_key, old_row, None)
+                old_row = next(old_rows, None)
+            elif old_row is None or new_key < old_key:
+                yield ("added", new_key, None, new_row)
+                new_row = next(new_rows, None)
+            else:
+                if old_row != new_row:
+                    yield ("changed", old_key, old_row, new_row)
+                old_row, new_row = next(old_rows, None), next(new_rows, None)
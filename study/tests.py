@@ -1,12 +1,26 @@
-from datetime import date
+import json
+import logging
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from io import StringIO
+from pathlib import Path
 from unittest import mock
 
 from django.contrib.auth import get_user_model
-from django.db import IntegrityError
-from django.test import TestCase
-from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 
-from .models import StudyEntry
+from . import audit_log, auth_backends, db_router, profiling, services, snapshots
+from .admission import get_admission_lane
+from .middleware import QueryInspectionMiddleware
+from .models import AuditEvent, IngestRequest, StudyEntry, StudyInstruction
+from .quality import build_quality_report
+from .query_budget import get_query_budget, record_queries
 
 
 class StudyEntryTests(TestCase):
@@ -111,12 +125,1043 @@ class StudyEntryTests(TestCase):
         self.assertEqual(response.status_code, 200)
 
 
+class ExportReplicationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="alice", password="pw12345")
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.staging_dir = Path(temp_dir.name) / "staging"
+        self.target = Path(temp_dir.name) / "share" / "study_export.xlsx"
+        overrides = override_settings(
+            EXPORT_STAGING_DIR=str(self.staging_dir),
+            DATA_XLSX_PATH=str(self.target),
+            EXPORT_REPLICATION_RETRIES=2,
+            EXPORT_REPLICATION_BACKOFF_SECONDS=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_export_serves_staged_copy_and_schedules_replication(self):
+        self.client.login(username="alice", password="pw12345")
+        with mock.patch("study.services.schedule_export_replication") as schedule:
+            response = self.client.get(reverse("export-excel"))
+
+        self.assertEqual(response.status_code, 200)
+        staged = self.staging_dir / "study_export.xlsx"
+        self.assertTrue(staged.exists())
+        self.assertFalse(self.target.exists())
+        schedule.assert_called_once()
+        self.assertEqual(services.get_export_replication_status()["state"], "pending")
+
+    def test_replication_copies_verified_file_to_share(self):
+        with mock.patch("study.services.schedule_export_replication") as schedule:
+            services.export_entries_to_excel()
+        source, target, built_at = schedule.call_args.args
+
+        self.assertTrue(services.replicate_export(source, target, built_at))
+        self.assertEqual(self.target.read_bytes(), Path(source).read_bytes())
+        status = services.get_export_replication_status()
+        self.assertEqual(status["state"], "replicated")
+        self.assertEqual(status["attempts"], 1)
+
+    def test_replication_failure_is_reported_after_retries(self):
+        with mock.patch("study.services.schedule_export_replication") as schedule:
+            services.export_entries_to_excel()
+        source, target, built_at = schedule.call_args.args
+
+        with mock.patch("study.services._copy_with_checksum", side_effect=OSError("share offline")):
+            self.assertFalse(services.replicate_export(source, target, built_at))
+
+        self.client.login(username="alice", password="pw12345")
+        status = self.client.get(reverse("export-status")).json()
+        self.assertEqual(status["state"], "failed")
+        self.assertEqual(status["attempts"], 2)
+        self.assertEqual(status["last_error"], "share offline")
+        self.assertGreaterEqual(status["lag_seconds"], 0)
+
+    def test_superseded_replication_is_skipped(self):
+        with mock.patch("study.services.schedule_export_replication") as schedule:
+            services.export_entries_to_excel()
+            stale_args = schedule.call_args.args
+            services.export_entries_to_excel()
+
+        self.assertFalse(services.replicate_export(*stale_args))
+        self.assertFalse(self.target.exists())
+
+    def test_replication_orphaned_by_dead_worker_is_resumed(self):
+        import subprocess
+        import sys
+
+        with mock.patch("study.services.schedule_export_replication") as schedule:
+            services.export_entries_to_excel()
+        source, target, built_at = schedule.call_args.args
+        dead_worker = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                                     capture_output=True, text=True, check=True)
+        services._update_replication_status(
+            built_at, state="replicating", attempts=1, pid=int(dead_worker.stdout)
+        )
+
+        with mock.patch("study.services.schedule_export_replication") as schedule:
+            self.assertEqual(services.get_export_replication_status()["state"], "pending")
+            services.get_export_replication_status()
+        schedule.assert_called_once_with(source, target, built_at)
+
+
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="alice", password="pw12345")
+        self.staff_user = get_user_model().objects.create_user(
+            username="admin", password="pw12345", is_staff=True
+        )
+        media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(media_dir.cleanup)
+        overrides = override_settings(
+            MEDIA_ROOT=media_dir.name,
+            DATA_XLSX_PATH=str(Path(media_dir.name) / "study_export.xlsx"),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def _create_rows(self, count):
+        for index in range(count):
+            author = get_user_model().objects.create_user(username=f"user{count}-{index}")
+            StudyEntry.objects.create(
+                piz=f"PIZ{count}-{index}",
+                examination_date=date(2024, 1, 1 + index % 28),
+                fibroscan_lsm_kpa="5.0",
+                fibroscan_cap_dbm="200.0",
+                created_by=author,
+                updated_by=author,
+            )
+            StudyInstruction.objects.create(
+                title=f"Instruction {count}-{index}",
+                pdf=SimpleUploadedFile(f"i{count}-{index}.pdf", b"%PDF-1.4"),
+                uploaded_by=author,
+            )
+
+    def _count_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data or {})
+        self.assertLess(response.status_code, 400, url)
+        return len(queries)
+
+    def assertWithinBudget(self, method, url, data=None):
+        budget = get_query_budget(resolve(url).func)
+        self.assertIsNotNone(budget, f"{url} declares no query budget")
+        count = self._count_queries(method, url, data)
+        self.assertLessEqual(count, budget, f"{method.upper()} {url}: {count} > {budget}")
+        return count
+
+    def test_every_study_view_declares_a_budget(self):
+        from .urls import urlpatterns
+
+        for pattern in urlpatterns:
+            self.assertIsNotNone(get_query_budget(pattern.callback), pattern.name)
+
+    def test_views_stay_within_budget(self):
+        self._create_rows(3)
+        entry = StudyEntry.objects.first()
+        instruction = StudyInstruction.objects.first()
+        self.client.login(username="admin", password="pw12345")
+        entry_data = {
+            "piz": "PIZ-NEW",
+            "examination_date": "2024-02-01",
+            "fibroscan_lsm_kpa": "6.0",
+            "fibroscan_cap_dbm": "210.0",
+        }
+
+        self.assertWithinBudget("get", reverse("entry-list"))
+        self.assertWithinBudget("get", reverse("entry-bulk-edit"))
+        self.assertWithinBudget(
+            "post", reverse("entry-bulk-edit"), {"created_by": self.staff_user.pk, "expected_count": 3}
+        )
+        self.assertWithinBudget("get", reverse("entry-create"))
+        self.assertWithinBudget("post", reverse("entry-create"), entry_data)
+        self.assertWithinBudget("get", reverse("entry-edit", kwargs={"pk": entry.pk}))
+        self.assertWithinBudget(
+            "post", reverse("entry-edit", kwargs={"pk": entry.pk}), {**entry_data, "piz": "PIZ-EDIT"}
+        )
+        self.assertWithinBudget("get", reverse("export-excel"))
+        self.assertWithinBudget("get", reverse("export-status"))
+        self.assertWithinBudget("get", reverse("instruction-list"))
+        self.assertWithinBudget("get", reverse("data-quality"))
+        self.assertWithinBudget("get", reverse("instruction-upload"))
+        self.assertWithinBudget(
+            "post",
+            reverse("instruction-upload"),
+            {"title": "New", "pdf": SimpleUploadedFile("new.pdf", b"%PDF-1.4")},
+        )
+        self.assertWithinBudget(
+            "get", reverse("instruction-download", kwargs={"pk": instruction.pk})
+        )
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        self.client.login(username="alice", password="pw12345")
+        self._create_rows(1)
+        entry_list = self._count_queries("get", reverse("entry-list"))
+        instruction_list = self._count_queries("get", reverse("instruction-list"))
+        self._create_rows(10)
+        self.assertEqual(self._count_queries("get", reverse("entry-list")), entry_list)
+        self.assertEqual(self._count_queries("get", reverse("instruction-list")), instruction_list)
+
+    def test_edit_fetches_entry_once(self):
+        self._create_rows(1)
+        entry = StudyEntry.objects.get()
+        self.client.login(username="admin", password="pw12345")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("entry-edit", kwargs={"pk": entry.pk}))
+        entry_selects = [
+            query["sql"] for query in queries if 'FROM "study_studyentry"' in query["sql"]
+        ]
+        self.assertEqual(len(entry_selects), 1)
+
+    @override_settings(DEBUG=True, QUERY_REPEAT_THRESHOLD=3)
+    def test_middleware_flags_repeated_queries(self):
+        def n_plus_one_view(request):
+            for _ in range(3):
+                list(get_user_model().objects.filter(pk=self.user.pk))
+            return None
+
+        middleware = QueryInspectionMiddleware(n_plus_one_view)
+        with self.assertLogs("study.queries", level="WARNING") as logs:
+            middleware(RequestFactory().get("/entries"))
+        self.assertIn("repeated 3 times", logs.output[0])
+
+
+@override_settings(REPLICA_HEALTH_CHECK_SECONDS=60, REPLICA_MAX_LAG_SECONDS=30)
+class ReadReplicaRoutingTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="alice", password="pw12345")
+        db_router._replica_health.clear()
+        self.addCleanup(db_router._replica_health.clear)
+
+    def _with_replicas(self, *aliases):
+        patcher = mock.patch("study.db_router.replica_aliases", return_value=list(aliases))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_primary_is_used_without_replicas(self):
+        self.assertEqual(db_router.read_alias(), "default")
+
+    def test_healthy_replica_serves_reads(self):
+        self._with_replicas("replica_1", "replica_2")
+        with mock.patch("study.db_router._check_replica", side_effect=lambda alias: alias == "replica_2"):
+            self.assertEqual(db_router.read_alias(), "replica_2")
+
+    def test_falls_back_to_primary_when_replicas_are_down(self):
+        self._with_replicas("replica_1")
+        with mock.patch("study.db_router._check_replica", return_value=False):
+            self.assertEqual(db_router.read_alias(), "default")
+
+    def test_lagging_replica_is_unhealthy_and_result_is_cached(self):
+        with mock.patch("study.db_router._replica_lag_seconds", return_value=120) as lag:
+            self.assertFalse(db_router.replica_is_healthy("default"))
+            self.assertFalse(db_router.replica_is_healthy("default"))
+        lag.assert_called_once()
+
+    def test_idle_replica_lag_depends_on_a_streaming_receiver(self):
+        from studydata.settings import _postgres_database
+
+        replica = mock.MagicMock(vendor="postgresql")
+        cursor = replica.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (0,)
+        with mock.patch("study.db_router.connections") as connections:
+            connections.__getitem__.return_value = replica
+            self.assertEqual(db_router._replica_lag_seconds("replica_1"), 0.0)
+            self.assertTrue(db_router._check_replica("replica_1"))
+            sql = cursor.execute.call_args.args[0]
+            self.assertIn("pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()", sql)
+            self.assertIn("pg_stat_wal_receiver", sql)
+
+            # No streaming WAL receiver: the query yields NULL and the replica is stale.
+            cursor.fetchone.return_value = (None,)
+            with self.assertLogs("study.db_router", level="WARNING"):
+                self.assertEqual(db_router._replica_lag_seconds("replica_1"), float("inf"))
+                self.assertFalse(db_router._check_replica("replica_1"))
+
+        config = _postgres_database("postgres://user:pw@replica-host/study", connect_timeout=3)
+        self.assertEqual(config["OPTIONS"], {"connect_timeout": 3})
+        self.assertNotIn("OPTIONS", _postgres_database("postgres://user:pw@primary-host/study"))
+
+    def test_own_writes_pin_reads_to_primary(self):
+        self._with_replicas("replica_1")
+        self.client.login(username="alice", password="pw12345")
+        self.client.post(
+            reverse("entry-create"),
+            {
+                "piz": "PIZ010",
+                "examination_date": "2024-01-01",
+                "fibroscan_lsm_kpa": "8.5",
+                "fibroscan_cap_dbm": "240.0",
+            },
+        )
+        request = RequestFactory().get("/entries")
+        request.session = self.client.session
+        with mock.patch("study.db_router._check_replica", return_value=True):
+            self.assertEqual(db_router.read_alias(request), "default")
+            request.session[db_router.PRIMARY_PIN_SESSION_KEY] = 0
+            self.assertEqual(db_router.read_alias(request), "replica_1")
+
+    def test_writes_and_migrations_stay_on_primary(self):
+        router = db_router.ReadReplicaRouter()
+        self.assertEqual(router.db_for_write(StudyEntry), "default")
+        self.assertFalse(router.allow_migrate("replica_1", "study"))
+        self.assertIsNone(router.allow_migrate("default", "study"))
+
+
+class DataQualityTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="alice", password="pw12345")
+        self.staff_user = get_user_model().objects.create_user(
+            username="admin", password="pw12345", is_staff=True
+        )
+        for day in range(1, 21):
+            StudyEntry.objects.create(
+                piz=f"PIZ{day:03d}",
+                examination_date=date(2024, 3, day),
+                fibroscan_lsm_kpa=f"{5 + day % 3}.0",
+                fibroscan_cap_dbm=f"{220 + day % 5}.0",
+            )
+
+    def _add_entry(self, piz, lsm, cap, exam_date=date(2024, 3, 25)):
+        return StudyEntry.objects.create(
+            piz=piz, examination_date=exam_date, fibroscan_lsm_kpa=lsm, fibroscan_cap_dbm=cap
+        )
+
+    def test_clean_dataset_has_no_findings(self):
+        report = build_quality_report()
+        self.assertEqual(report["row_count"], 20)
+        for check in ("near_duplicate_piz", "implausible_measurements", "lsm_monthly_outliers", "edit_bursts"):
+            self.assertEqual(report[check]["count"], 0, check)
+
+    def test_near_duplicate_piz_variants_are_grouped(self):
+        self._add_entry("piz-001", "5.0", "220.0")
+        self._add_entry(" PIZ 001", "5.0", "220.0", exam_date=date(2024, 3, 26))
+        items = build_quality_report()["near_duplicate_piz"]["items"]
+        self.assertEqual(items, [{"key": "PIZ001", "variants": [" PIZ 001", "PIZ001", "piz-001"]}])
+
+    def test_implausible_and_outlier_measurements_are_flagged(self):
+        implausible = self._add_entry("PIZ900", "0.00", "0.00")
+        outlier = self._add_entry("PIZ901", "60.0", "221.0")
+        report = build_quality_report()
+        self.assertEqual(
+            [item["id"] for item in report["implausible_measurements"]["items"]], [implausible.id]
+        )
+        lsm_outliers = {item["id"] for item in report["lsm_monthly_outliers"]["items"]}
+        self.assertEqual(lsm_outliers, {implausible.id, outlier.id})
+
+    def test_edit_bursts_are_detected_per_user(self):
+        AuditEvent.objects.bulk_create(
+            [AuditEvent(action="entry_update", username="bob", details="") for _ in range(30)]
+            + [AuditEvent(action="entry_update", username="carol", details="") for _ in range(5)]
+        )
+        start = AuditEvent.objects.order_by("id").first().created_at
+        for index, event in enumerate(AuditEvent.objects.filter(username="carol")):
+            event.created_at = start + timedelta(hours=index)
+            event.save(update_fields=["created_at"])
+        items = build_quality_report()["edit_bursts"]["items"]
+        self.assertEqual(items, [{"username": "bob", "max_events_in_window": 30}])
+
+    def test_quality_page_is_staff_only(self):
+        self.client.login(username="alice", password="pw12345")
+        self.assertEqual(self.client.get(reverse("data-quality")).status_code, 403)
+        self.client.login(username="admin", password="pw12345")
+        response = self.client.get(reverse("data-quality"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Scanned 20 entries")
+
+    def test_management_command_prints_summary(self):
+        output = StringIO()
+        call_command("data_quality", stdout=output)
+        self.assertIn("Scanned 20 entries", output.getvalue())
+
+
+class SegmentedAuditLogTests(TestCase):
+    SEGMENT = 3600
+    MARCH_1 = datetime(2024, 3, 1, tzinfo=timezone.utc).timestamp()
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = Path(temp_dir.name)
+        self.handler = audit_log.SegmentedAuditFileHandler(self.directory, self.SEGMENT)
+
+    def _emit(self, created, action, user):
+        record = logging.makeLogRecord(
+            {"msg": action, "created": created, "audit": {"action": action, "user": user, "details": ""}}
+        )
+        self.handler.emit(record)
+
+    def _populate(self):
+        self._emit(self.MARCH_1 + 10, "entry_create", "alice")
+        self._emit(self.MARCH_1 + 20, "entry_update", "bob")
+        self._emit(self.MARCH_1 + self.SEGMENT + 5, "entry_update", "bob")
+        self._emit(self.MARCH_1 + 2 * self.SEGMENT + 5, "export_excel", "alice")
+
+    def test_records_are_json_lines_in_time_segments(self):
+        self._populate()
+        segments = sorted(path.name for path in self.directory.glob("audit-*"))
+        self.assertEqual(
+            segments,
+            ["audit-20240301T000000Z.jsonl", "audit-20240301T010000Z.jsonl", "audit-20240301T020000Z.jsonl"],
+        )
+        first = (self.directory / segments[0]).read_text(encoding="utf-8").splitlines()
+        self.assertEqual(
+            json.loads(first[0]),
+            {"ts": "2024-03-01T00:00:10.000000+00:00", "action": "entry_create", "user": "alice", "details": ""},
+        )
+
+    def test_closed_segments_are_compressed_and_indexed(self):
+        self._populate()
+        now = self.MARCH_1 + 2 * self.SEGMENT + audit_log.COMPACTION_GRACE_SECONDS + 1
+        self.assertEqual(audit_log.compact_closed_segments(self.directory, self.SEGMENT, now=now), 2)
+
+        index = audit_log.read_index(self.directory)
+        self.assertEqual([segment["file"] for segment in index], [
+            "audit-20240301T000000Z.jsonl.gz", "audit-20240301T010000Z.jsonl.gz"
+        ])
+        self.assertEqual(index[0]["users"], ["alice", "bob"])
+        self.assertEqual(index[0]["count"], 2)
+        self.assertTrue((self.directory / "audit-20240301T020000Z.jsonl").exists())
+
+    def test_torn_line_is_skipped_and_other_segments_stay_indexed(self):
+        self._populate()
+        with (self.directory / "audit-20240301T010000Z.jsonl").open("a", encoding="utf-8") as handle:
+            handle.write('{"ts": "2024-03-01T01:00:0')
+
+        now = self.MARCH_1 + 10 * self.SEGMENT
+        with self.assertLogs("study.audit_log", level="WARNING") as logs:
+            self.assertEqual(audit_log.compact_closed_segments(self.directory, self.SEGMENT, now=now), 3)
+        self.assertIn("Skipped 1 undecodable audit line(s)", logs.output[0])
+        self.assertEqual([segment["count"] for segment in audit_log.read_index(self.directory)], [2, 1, 1])
+        self.assertEqual(list(self.directory.glob("*.jsonl")), [])
+        records = list(audit_log.query_audit_log(self.directory, self.SEGMENT, user="bob"))
+        self.assertEqual(len(records), 2)
+
+    def test_rerun_after_crash_before_unlink_does_not_duplicate(self):
+        self._populate()
+        now = self.MARCH_1 + 10 * self.SEGMENT
+        real_unlink = Path.unlink
+
+        def crash_on_claimed(path, *args, **kwargs):
+            if path.name.endswith(audit_log.CLAIMED_SUFFIX):
+                raise RuntimeError("worker killed")
+            return real_unlink(path, *args, **kwargs)
+
+        with mock.patch.object(Path, "unlink", crash_on_claimed):
+            with self.assertRaises(RuntimeError):
+                audit_log.compact_closed_segments(self.directory, self.SEGMENT, now=now)
+        # Meanwhile, queries neither lose nor double the interrupted segment.
+        self.assertEqual(len(list(audit_log.query_audit_log(self.directory, self.SEGMENT))), 4)
+
+        self.assertEqual(audit_log.compact_closed_segments(self.directory, self.SEGMENT, now=now), 3)
+        index = audit_log.read_index(self.directory)
+        self.assertEqual([segment["count"] for segment in index], [2, 1, 1])
+        self.assertFalse(any("pending_base_size" in segment for segment in index))
+        self.assertEqual(len(list(audit_log.query_audit_log(self.directory, self.SEGMENT))), 4)
+
+    def test_writes_never_compact_and_command_does(self):
+        self._populate()
+        self.assertEqual(list(self.directory.glob("*.gz")), [])
+
+        output = StringIO()
+        with override_settings(AUDIT_LOG_DIR=self.directory, AUDIT_SEGMENT_SECONDS=self.SEGMENT):
+            call_command("compact_audit_log", stdout=output)
+        self.assertIn("Compacted 3 segment(s)", output.getvalue())
+        self.assertEqual(len(audit_log.read_index(self.directory)), 3)
+
+    def test_query_opens_only_matching_segments(self):
+        self._populate()
+        audit_log.compact_closed_segments(self.directory, self.SEGMENT, now=self.MARCH_1 + 10 * self.SEGMENT)
+
+        opened = []
+        real_iter_lines = audit_log._iter_lines
+
+        def tracking_iter_lines(path, limit=None):
+            opened.append(path.name)
+            return real_iter_lines(path, limit)
+
+        with mock.patch("study.audit_log._iter_lines", side_effect=tracking_iter_lines):
+            records = list(
+                audit_log.query_audit_log(
+                    self.directory,
+                    self.SEGMENT,
+                    user="bob",
+                    since=datetime(2024, 3, 1, 1, tzinfo=timezone.utc),
+                )
+            )
+        self.assertEqual([record["ts"] for record in records], ["2024-03-01T01:00:05.000000+00:00"])
+        self.assertEqual(opened, ["audit-20240301T010000Z.jsonl.gz"])
+
+    def test_audit_query_command_prints_json_lines(self):
+        self._populate()
+        output = StringIO()
+        with override_settings(AUDIT_LOG_DIR=self.directory, AUDIT_SEGMENT_SECONDS=self.SEGMENT):
+            call_command("audit_query", "--user", "alice", "--action", "export_excel", stdout=output)
+        self.assertEqual(json.loads(output.getvalue())["action"], "export_excel")
+
+
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="alice", password="pw12345")
+        StudyEntry.objects.create(
+            piz="PIZ001",
+            examination_date=date(2024, 1, 1),
+            fibroscan_lsm_kpa="5.1",
+            fibroscan_cap_dbm="100.0",
+            created_by=self.user,
+            updated_by=self.user,
+        )
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.cached_mode = override_settings(
+            CACHED_AUTH=True,
+            AUTH_CACHE_DIR=temp_dir.name,
+            AUTH_USER_CACHE_SECONDS=60,
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "sessions": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": str(Path(temp_dir.name) / "sessions"),
+                },
+            },
+            SESSION_CACHE_ALIAS="sessions",
+            SESSION_ENGINE="django.contrib.sessions.backends.cached_db",
+            MESSAGE_STORAGE="django.contrib.messages.storage.cookie.CookieStorage",
+            AUTHENTICATION_BACKENDS=["study.auth_backends.CachedModelBackend"],
+        )
+        cache.clear()
+        auth_backends._user_cache.clear()
+        self.addCleanup(auth_backends._user_cache.clear)
+
+    def _entry_list_queries(self):
+        self.client.get(reverse("entry-list"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("entry-list"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_entry_list_skips_session_and_user_queries(self):
+        self.client.login(username="alice", password="pw12345")
+        default_queries = self._entry_list_queries()
+        self.client.logout()
+
+        with self.cached_mode:
+            # SessionMiddleware binds its engine when the client's handler is built.
+            self.client = self.client_class()
+            self.client.login(username="alice", password="pw12345")
+            cached_queries = self._entry_list_queries()
+
+        self.assertEqual(default_queries, 4)
+        self.assertEqual(cached_queries, 2)
+
+    def test_deactivated_user_is_evicted(self):
+        with self.cached_mode:
+            self.client.login(username="alice", password="pw12345")
+            self._entry_list_queries()
+            self.user.is_active = False
+            self.user.save()
+            response = self.client.get(reverse("entry-list"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_session_deleted_in_database_is_not_served_from_cache(self):
+        from django.contrib.sessions.models import Session
+
+        with self.cached_mode:
+            self.client = self.client_class()
+            self.client.login(username="alice", password="pw12345")
+            self._entry_list_queries()
+            Session.objects.all().delete()
+            response = self.client.get(reverse("entry-list"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_cache_directories_must_be_private(self):
+        import os
+        import stat
+
+        from django.core.exceptions import ImproperlyConfigured
+        from studydata import settings as project_settings
+
+        self.assertEqual(project_settings.AUTH_CACHE_DIR, project_settings.INSTANCE_DIR / "auth-cache")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            directory = project_settings._private_directory(Path(temp_dir) / "sessions")
+            self.assertEqual(stat.S_IMODE(directory.stat().st_mode), 0o700)
+            directory.chmod(0o777)
+            project_settings._private_directory(directory)
+            self.assertEqual(stat.S_IMODE(directory.stat().st_mode), 0o700)
+            with mock.patch("os.getuid", return_value=os.getuid() + 1):
+                with self.assertRaises(ImproperlyConfigured):
+                    project_settings._private_directory(directory)
+
+    def test_password_change_ends_other_sessions(self):
+        with self.cached_mode:
+            self.client.login(username="alice", password="pw12345")
+            self._entry_list_queries()
+            # Simulate another worker: only the marker file tells this one to reload.
+            user = get_user_model().objects.get(pk=self.user.pk)
+            user.set_password("new-pw-67890")
+            with mock.patch.dict(auth_backends._user_cache):
+                user.save()
+            response = self.client.get(reverse("entry-list"))
+        self.assertEqual(response.status_code, 302)
+
+
+class ApiBatchIngestTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="gateway", password="pw12345")
+        self.token = services.create_api_token(self.user, "fibroscan-gateway")
+        self.existing = StudyEntry.objects.create(
+            piz="PIZ001",
+            examination_date=date(2024, 1, 1),
+            fibroscan_lsm_kpa="5.0",
+            fibroscan_cap_dbm="200.0",
+            created_by=self.user,
+        )
+
+    def _post(self, payload, key=None, token=None):
+        headers = {"Authorization": f"Token {token or self.token}"}
+        if key:
+            headers["Idempotency-Key"] = key
+        return self.client.post(
+            reverse("api-entry-batch"),
+            data=json.dumps(payload),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def _batch(self):
+        return {
+            "entries": [
+                {"piz": "PIZ001", "examination_date": "2024-01-01", "fibroscan_lsm_kpa": 9.5, "fibroscan_cap_dbm": 250},
+                {"piz": "PIZ002", "examination_date": "2024-01-02", "liver_ambulance_link": True,
+                 "fibroscan_lsm_kpa": "6.1", "fibroscan_cap_dbm": "230.0"},
+                {"piz": "PIZ003", "examination_date": "2024-01-03", "fibroscan_lsm_kpa": 500, "fibroscan_cap_dbm": 230},
+                {"piz": "PIZ002", "examination_date": "2024-01-02", "fibroscan_lsm_kpa": 6.1, "fibroscan_cap_dbm": 230},
+            ]
+        }
+
+    def test_requires_valid_token(self):
+        self.assertEqual(self._post(self._batch(), token="wrong").status_code, 401)
+        self.assertEqual(self.client.get(reverse("api-entry-batch")).status_code, 405)
+
+    def test_batch_upserts_and_reports_per_item_results(self):
+        response = self._post(self._batch())
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["created"], body["updated"], body["invalid"]), (1, 1, 2))
+        statuses = [result["status"] for result in body["results"]]
+        self.assertEqual(statuses, ["updated", "created", "invalid", "invalid"])
+        self.assertIn("fibroscan_lsm_kpa", body["results"][2]["errors"])
+
+        self.existing.refresh_from_db()
+        self.assertEqual(str(self.existing.fibroscan_lsm_kpa), "9.50")
+        self.assertEqual(self.existing.updated_by, self.user)
+        created = StudyEntry.objects.get(pk=body["results"][1]["id"])
+        self.assertEqual(created.created_by, self.user)
+        self.assertTrue(created.liver_ambulance_link)
+        self.assertTrue(AuditEvent.objects.filter(action="entry_ingest").exists())
+
+    def test_non_staff_token_cannot_change_other_users_entries(self):
+        other = get_user_model().objects.create_user(username="bob", password="pw12345")
+        self.existing.created_by = other
+        self.existing.save()
+
+        body = self._post(self._batch()).json()
+        self.assertEqual((body["created"], body["updated"], body["forbidden"]), (1, 0, 1))
+        self.assertEqual(body["results"][0]["status"], "forbidden")
+        self.existing.refresh_from_db()
+        self.assertEqual(str(self.existing.fibroscan_lsm_kpa), "5.00")
+        self.assertEqual(self.existing.created_by, other)
+
+    def test_entry_inserted_concurrently_by_other_user_is_not_overwritten(self):
+        other = get_user_model().objects.create_user(username="bob", password="pw12345")
+        racing = StudyEntry.objects.create(
+            piz="PIZ002",
+            examination_date=date(2024, 1, 2),
+            fibroscan_lsm_kpa="4.0",
+            fibroscan_cap_dbm="190.0",
+            created_by=other,
+        )
+        # The row appears after the locked lookup, as if bob committed in between.
+        real_select_for_update = StudyEntry.objects.select_for_update
+        with mock.patch.object(
+            StudyEntry.objects,
+            "select_for_update",
+            side_effect=lambda: real_select_for_update().exclude(pk=racing.pk),
+        ):
+            body = self._post(self._batch()).json()
+
+        self.assertEqual([result["status"] for result in body["results"]][:2], ["updated", "forbidden"])
+        racing.refresh_from_db()
+        self.assertEqual((str(racing.fibroscan_lsm_kpa), racing.created_by), ("4.00", other))
+
+    def test_retry_with_idempotency_key_is_a_cheap_no_op(self):
+        with CaptureQueriesContext(connection) as first_queries:
+            first = self._post(self._batch(), key="upload-42").json()
+        self.assertLessEqual(len(first_queries), get_query_budget(resolve(reverse("api-entry-batch")).func))
+
+        StudyEntry.objects.filter(piz="PIZ002").update(fibroscan_lsm_kpa="7.7")
+        with CaptureQueriesContext(connection) as retry_queries:
+            retry = self._post(self._batch(), key="upload-42").json()
+
+        self.assertEqual(retry, first)
+        self.assertEqual(len(retry_queries), 2)
+        self.assertEqual(str(StudyEntry.objects.get(piz="PIZ002").fibroscan_lsm_kpa), "7.70")
+        self.assertEqual(IngestRequest.objects.count(), 1)
+
+    def test_reusing_key_with_other_payload_is_rejected(self):
+        self._post(self._batch(), key="upload-43")
+        response = self._post({"entries": []}, key="upload-43")
+        self.assertEqual(response.status_code, 422)
+
+    def test_malformed_and_oversized_batches_are_rejected(self):
+        self.assertEqual(self._post(["not", "an", "object"]).status_code, 400)
+        with override_settings(API_MAX_BATCH_SIZE=2):
+            self.assertEqual(self._post(self._batch()).status_code, 413)
+
+
+class ExportSnapshotTests(TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_path = Path(temp_dir.name)
+        overrides = override_settings(
+            DATA_XLSX_PATH=str(self.temp_path / "study_export.xlsx"),
+            EXPORT_SNAPSHOT_DIR=str(self.temp_path / "snapshots"),
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.store = snapshots.SnapshotStore(self.temp_path / "snapshots")
+
+    def _rows(self, count, changed=None):
+        rows = []
+        for index in range(count):
+            lsm = 9.9 if index == changed else 5.0
+            rows.append([f"PIZ{index:05d}", "2024-01-01", "no", lsm, 200.0, "", "", "", ""])
+        return rows
+
+    def test_unchanged_chunks_are_shared_between_snapshots(self):
+        first = self.store.record(services.EXPORT_HEADER, self._rows(5000))
+        second = self.store.record(services.EXPORT_HEADER, self._rows(5000, changed=2500))
+
+        self.assertGreater(len(first["chunks"]), 3)
+        self.assertEqual(len(set(first["chunks"]) - set(second["chunks"])), 1)
+        objects = list((self.temp_path / "snapshots" / "objects").rglob("*"))
+        self.assertEqual(
+            len([path for path in objects if path.is_file()]), len(first["chunks"]) + 1
+        )
+
+    def test_diff_lists_added_changed_and_removed_entries(self):
+        old_rows = self._rows(3000)
+        new_rows = self._rows(3000, changed=10)
+        del new_rows[20]
+        new_rows.append(["PIZ99999", "2024-01-02", "yes", 6.0, 210.0, "", "", "", ""])
+        old = self.store.record(services.EXPORT_HEADER, old_rows)
+        new = self.store.record(services.EXPORT_HEADER, new_rows)
+
+        changes = [(kind, key) for kind, key, _, _ in self.store.diff(old["id"], new["id"])]
+        self.assertEqual(
+            changes,
+            [
+                ("changed", ("2024-01-01", "PIZ00010")),
+                ("removed", ("2024-01-01", "PIZ00020")),
+                ("added", ("2024-01-02", "PIZ99999")),
+            ],
+        )
+
+    def test_restore_keeps_database_order_and_diff_still_merges(self):
+        from openpyxl import load_workbook
+
+        # Case-insensitive collation order, which differs from Python's ("B2" < "a1").
+        rows = [
+            ["a1", "2024-01-01", "no", 5.0, 200.0, "", "", "", ""],
+            ["B2", "2024-01-01", "no", 6.0, 210.0, "", "", "", ""],
+            ["c3", "2024-01-01", "no", 7.0, 220.0, "", "", "", ""],
+        ]
+        old = self.store.record(services.EXPORT_HEADER, rows)
+        changed = [*rows[1][:3], 9.0, *rows[1][4:]]
+        new = self.store.record(services.EXPORT_HEADER, [rows[0], changed, rows[2]])
+
+        target = self.temp_path / "restored.xlsx"
+        self.store.restore(old["id"], target)
+        self.assertEqual([row[0] for row in load_workbook(target).active.values][1:], ["a1", "B2", "c3"])
+        changes = [(kind, key) for kind, key, _, _ in self.store.diff(old["id"], new["id"])]
+        self.assertEqual(changes, [("changed", ("2024-01-01", "B2"))])
+
+    def test_failed_export_records_no_snapshot(self):
+        with mock.patch("study.services._save_workbook_atomically", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                services.export_entries_to_excel()
+        self.assertEqual(self.store.list(), [])
+
+    def test_export_records_snapshot_that_restores_to_xlsx(self):
+        from openpyxl import load_workbook
+
+        StudyEntry.objects.create(
+            piz="PIZ001",
+            examination_date=date(2024, 1, 1),
+            fibroscan_lsm_kpa="5.1",
+            fibroscan_cap_dbm="100.0",
+        )
+        services.export_entries_to_excel()
+        (manifest,) = self.store.list()
+        self.assertEqual(manifest["row_count"], 1)
+
+        target = self.temp_path / "restored.xlsx"
+        output = StringIO()
+        call_command("export_snapshots", "restore", manifest["id"], str(target), stdout=output)
+        restored = list(load_workbook(target).active.values)
+        exported = list(load_workbook(self.temp_path / "study_export.xlsx").active.values)
+        self.assertEqual(restored, exported)
+
+
+class AdmissionControlTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="alice", password="pw12345")
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = Path(temp_dir.name)
+        overrides = override_settings(
+            ADMISSION_CONTROL_DIR=temp_dir.name,
+            DATA_XLSX_PATH=str(self.directory / "study_export.xlsx"),
+            ADMISSION_LANES={
+                "heavy": {"slots": 1, "rate": 2, "per_seconds": 3600, "retry_after": 10},
+                "search": {"slots": 2, "rate": 100, "per_seconds": 60, "retry_after": 2},
+            },
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.login(username="alice", password="pw12345")
+
+    def test_lanes_are_assigned_per_request(self):
+        view = resolve(reverse("entry-list")).func
+        factory = RequestFactory()
+        self.assertIsNone(get_admission_lane(view, factory.get("/entries")))
+        self.assertEqual(get_admission_lane(view, factory.get("/entries", {"piz": "PIZ"})), "search")
+        bounded = factory.get(
+            "/entries", {"piz": "PIZ", "start_date": "2024-01-01", "end_date": "2024-01-31"}
+        )
+        self.assertIsNone(get_admission_lane(view, bounded))
+        self.assertIsNone(get_admission_lane(resolve(reverse("instruction-list")).func, bounded))
+
+    def test_busy_lane_sheds_expensive_requests_but_not_cheap_ones(self):
+        # Another worker holds the only heavy slot.
+        with services.advisory_export_lock(str(self.directory / "heavy-0.slot")):
+            response = self.client.get(reverse("export-excel"))
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], "10")
+            self.assertEqual(self.client.get(reverse("instruction-list")).status_code, 200)
+
+        self.assertEqual(self.client.get(reverse("export-excel")).status_code, 200)
+
+    def test_concurrent_unfiltered_lists_are_never_shed(self):
+        other = get_user_model().objects.create_user(username="bob", password="pw12345")
+        other_client = self.client_class()
+        other_client.force_login(other)
+        # Other workers are serving searches and hold every search slot.
+        with services.advisory_export_lock(
+            str(self.directory / "search-0.slot")
+        ), services.advisory_export_lock(str(self.directory / "search-1.slot")):
+            self.assertEqual(self.client.get(reverse("entry-list")).status_code, 200)
+            self.assertEqual(other_client.get(reverse("entry-list")).status_code, 200)
+            searching = other_client.get(reverse("entry-list"), {"piz": "PIZ"})
+            self.assertEqual(searching.status_code, 503)
+
+    def test_shed_requests_do_not_use_up_the_rate(self):
+        with services.advisory_export_lock(str(self.directory / "heavy-0.slot")):
+            for _ in range(3):
+                self.assertEqual(self.client.get(reverse("export-excel")).status_code, 503)
+        self.assertEqual(self.client.get(reverse("export-excel")).status_code, 200)
+
+    def test_lanes_from_environment_are_parsed_and_checked(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from studydata.settings import _admission_lanes
+
+        lanes = {
+            "heavy": {"slots": 1, "rate": 6, "per_seconds": 60, "retry_after": 10},
+            "search": {"slots": 1, "rate": 60, "per_seconds": 60, "retry_after": 2},
+        }
+        self.assertEqual(_admission_lanes(json.dumps(lanes)), lanes)
+        broken = {**lanes, "search": {"slots": 1, "rate": 60}}
+        for value in ("not json", json.dumps(broken), json.dumps({"heavy": lanes["heavy"]})):
+            with self.assertRaises(ImproperlyConfigured):
+                _admission_lanes(value)
+
+    def test_default_lanes_leave_a_worker_free(self):
+        from studydata import settings as project_settings
+
+        total_slots = sum(lane["slots"] for lane in project_settings.ADMISSION_LANES.values())
+        # The documented deployment runs gunicorn with --workers 3.
+        self.assertLess(total_slots, 3)
+
+    def test_per_user_rate_limit_returns_429(self):
+        self.assertEqual(self.client.get(reverse("export-excel")).status_code, 200)
+        self.assertEqual(self.client.get(reverse("export-excel")).status_code, 200)
+        response = self.client.get(reverse("export-excel"))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        self.assertEqual(self.client.get(reverse("entry-list")).status_code, 200)
+
+
+class RequestProfilingTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="alice", password="pw12345")
+        self.staff_user = get_user_model().objects.create_user(
+            username="admin", password="pw12345", is_staff=True
+        )
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = Path(temp_dir.name)
+        overrides = override_settings(PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=0)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_staff_flag_stores_profile_with_sql(self):
+        self.client.login(username="admin", password="pw12345")
+        response = self.client.get(reverse("entry-list"), {"_profile": "1"})
+        profile = profiling.load_profile(self.directory, response["X-Profile-Id"])
+        self.assertEqual(profile["path"], "/entries?_profile=1")
+        self.assertEqual(profile["user"], "admin")
+        self.assertEqual(profile["trigger"], "requested")
+        self.assertTrue(any("study_studyentry" in query["sql"] for query in profile["sql"]))
+
+    def test_queries_on_replica_aliases_are_recorded(self):
+        from django.db import connections
+
+        replica = connections.create_connection("default")
+        replica.alias = "replica_1"
+        self.addCleanup(replica.close)
+        with mock.patch.object(connections, "all", return_value=[connection, replica]):
+            with profiling.RequestProfiler(interval_ms=50) as profiler, record_queries() as recorder:
+                with replica.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+        self.assertEqual(
+            [(query["alias"], query["sql"]) for query in profiler.sql.queries], [("replica_1", "SELECT 1")]
+        )
+        self.assertEqual(recorder.statements, ["SELECT 1"])
+
+    def test_non_staff_flag_is_ignored_but_sampling_applies(self):
+        self.client.login(username="alice", password="pw12345")
+        response = self.client.get(reverse("entry-list"), headers={"X-Profile": "1"})
+        self.assertNotIn("X-Profile-Id", response)
+        with override_settings(PROFILE_SAMPLE_RATE=1.0):
+            response = self.client.get(reverse("instruction-list"))
+        self.assertEqual(profiling.load_profile(self.directory, response["X-Profile-Id"])["trigger"], "sampled")
+
+    def test_retention_keeps_newest_profiles(self):
+        ids = [
+            profiling.save_profile(self.directory, {"sql": [], "stacks": {}}, max_files=2)
+            for _ in range(3)
+        ]
+        self.assertEqual(sorted(path.stem for path in self.directory.glob("*.json")), ids[1:])
+
+    def test_staff_can_browse_and_download_folded_stacks(self):
+        profile_id = profiling.save_profile(
+            self.directory,
+            {
+                "method": "GET", "path": "/entries", "user": "alice", "status": 200,
+                "trigger": "sampled", "duration_ms": 12.0, "sample_interval_ms": 2,
+                "sql": [{"sql": "SELECT 1", "duration_ms": 0.5}],
+                "stacks": {"django:handler;study.views:get": 3, "django:handler": 1},
+            },
+            max_files=10,
+        )
+        self.client.login(username="alice", password="pw12345")
+        self.assertEqual(self.client.get(reverse("profile-list")).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse("profile-download", args=[profile_id])).status_code, 403
+        )
+
+        self.client.login(username="admin", password="pw12345")
+        self.assertContains(self.client.get(reverse("profile-list")), profile_id)
+        self.assertContains(self.client.get(reverse("profile-detail", args=[profile_id])), "study.views:get")
+        response = self.client.get(reverse("profile-download", args=[profile_id]))
+        self.assertEqual(response.content.decode(), "django:handler 1\ndjango:handler;study.views:get 3\n")
+        self.assertEqual(self.client.get(reverse("profile-detail", args=["missing"])).status_code, 404)
+
+
+class BulkEditTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="alice", password="pw12345")
+        self.other_user = get_user_model().objects.create_user(username="bob", password="pw12345")
+        self.staff_user = get_user_model().objects.create_user(
+            username="admin", password="pw12345", is_staff=True
+        )
+        for day, owner in ((1, self.user), (2, self.user), (3, self.other_user), (20, self.user)):
+            StudyEntry.objects.create(
+                piz=f"PIZ{day:03d}",
+                examination_date=date(2024, 1, day),
+                fibroscan_lsm_kpa="5.0",
+                fibroscan_cap_dbm="200.0",
+                created_by=owner,
+                updated_by=owner,
+            )
+        self.week = "?start_date=2024-01-01&end_date=2024-01-07"
+
+    def test_preview_counts_only_editable_entries(self):
+        self.client.login(username="alice", password="pw12345")
+        response = self.client.get(reverse("entry-bulk-edit") + self.week)
+        self.assertEqual(response.context["selection_count"], 2)
+        self.assertNotIn("created_by", response.context["form"].fields)
+
+        self.client.login(username="admin", password="pw12345")
+        response = self.client.get(reverse("entry-bulk-edit") + self.week)
+        self.assertEqual(response.context["selection_count"], 3)
+
+    def test_apply_updates_selection_with_one_update_and_one_audit_event(self):
+        self.client.login(username="alice", password="pw12345")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("entry-bulk-edit") + self.week,
+                {"liver_ambulance_link": "yes", "expected_count": 2},
+            )
+        self.assertEqual(response.status_code, 302)
+        updates = [query["sql"] for query in queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+
+        changed = StudyEntry.objects.filter(liver_ambulance_link=True)
+        self.assertEqual(sorted(changed.values_list("piz", flat=True)), ["PIZ001", "PIZ002"])
+        self.assertTrue(all(entry.updated_by == self.user for entry in changed))
+        event = AuditEvent.objects.get(action="entry_bulk_update")
+        ids = ",".join(str(pk) for pk in changed.order_by("id").values_list("id", flat=True))
+        self.assertEqual(event.details, f"liver_ambulance_link=True entry_ids={ids}")
+
+    def test_staff_can_reassign_entries_of_departed_user(self):
+        self.client.login(username="admin", password="pw12345")
+        response = self.client.post(
+            reverse("entry-bulk-edit") + "?piz=PIZ0",
+            {"created_by": self.other_user.pk, "expected_count": 4},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(StudyEntry.objects.filter(created_by=self.other_user).count(), 4)
+
+    def test_changed_selection_is_not_applied(self):
+        self.client.login(username="alice", password="pw12345")
+        response = self.client.post(
+            reverse("entry-bulk-edit") + self.week,
+            {"liver_ambulance_link": "yes", "expected_count": 3},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["selection_count"], 2)
+        self.assertFalse(StudyEntry.objects.filter(liver_ambulance_link=True).exists())
+        self.assertFalse(AuditEvent.objects.filter(action="entry_bulk_update").exists())
+
+    def test_non_staff_cannot_reassign(self):
+        self.client.login(username="alice", password="pw12345")
+        self.client.post(
+            reverse("entry-bulk-edit") + self.week,
+            {"created_by": self.other_user.pk, "expected_count": 2},
+        )
+        self.assertEqual(StudyEntry.objects.filter(created_by=self.other_user).count(), 1)
+
+
 class ServicesImportTests(TestCase):
     def test_services_import_works_without_fcntl(self):
         import importlib
         import sys
 
         sys.modules.pop("study.services", None)
+        sys.modules.pop("study.locks", None)
         real_import = __import__
 
         def mocked_import(name, *args, **kwargs):
@@ -129,3 +1174,4 @@ class ServicesImportTests(TestCase):
 
         self.assertTrue(hasattr(module, "export_entries_to_excel"))
         sys.modules.pop("study.services", None)
+        sys.modules.pop("study.locks", None)
@@ -1,21 +1,35 @@
 from django.urls import path
 
 from .views import (
+    DataQualityView,
+    EntryBulkEditView,
     EntryCreateView,
     EntryListView,
     EntryUpdateView,
     InstructionListView,
     InstructionUploadView,
+    ProfileDetailView,
+    ProfileListView,
+    api_entry_batch_view,
     export_excel_view,
+    export_status_view,
     instruction_download_view,
+    profile_download_view,
 )
 
 urlpatterns = [
     path("entries", EntryListView.as_view(), name="entry-list"),
     path("entries/new", EntryCreateView.as_view(), name="entry-create"),
     path("entries/<int:pk>/edit", EntryUpdateView.as_view(), name="entry-edit"),
+    path("entries/bulk-edit", EntryBulkEditView.as_view(), name="entry-bulk-edit"),
     path("export/excel", export_excel_view, name="export-excel"),
+    path("export/status", export_status_view, name="export-status"),
+    path("quality", DataQualityView.as_view(), name="data-quality"),
+    path("profiles", ProfileListView.as_view(), name="profile-list"),
+    path("profiles/<slug:profile_id>", ProfileDetailView.as_view(), name="profile-detail"),
+    path("profiles/<slug:profile_id>/folded", profile_download_view, name="profile-download"),
     path("instructions", InstructionListView.as_view(), name="instruction-list"),
     path("instructions/upload", InstructionUploadView.as_view(), name="instruction-upload"),
     path("instructions/<int:pk>/download", instruction_download_view, name="instruction-download"),
+    path("api/entries/batch", api_entry_batch_view, name="api-entry-batch"),
 ]
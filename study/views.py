@@ -1,19 +1,62 @@
+import hashlib
+import json
 from pathlib import Path
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
-from django.urls import reverse_lazy
-from django.views.generic import CreateView, ListView, UpdateView
+from django.urls import reverse, reverse_lazy
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from django.views.generic import CreateView, FormView, ListView, TemplateView, UpdateView
 
-from .forms import StudyEntryForm, StudyInstructionForm
+from .admission import admission_lane
+from .db_router import pin_to_primary, read_alias
+from .forms import EntryBulkEditForm, StudyEntryForm, StudyInstructionForm
 from .models import StudyEntry, StudyInstruction
-from .services import ExportLockError, export_entries_to_excel, write_audit_event
+from .profiling import (
+    ProfileNotFoundError,
+    folded_stacks,
+    list_profiles,
+    load_profile,
+    top_functions,
+)
+from .quality import build_quality_report
+from .query_budget import query_budget
+from .services import (
+    BulkEditConflictError,
+    ExportLockError,
+    IngestConflictError,
+    bulk_update_entries,
+    can_edit_entry,
+    editable_entries,
+    export_entries_to_excel,
+    get_export_replication_status,
+    ingest_entries,
+    user_for_api_token,
+    write_audit_event,
+)
+
+
+def filter_entries(queryset, params):
+    """Apply the entry list filters (PIZ substring, examination date range) from ``params``."""
+    piz = params.get("piz", "").strip()
+    start = params.get("start_date", "").strip()
+    end = params.get("end_date", "").strip()
+    if piz:
+        queryset = queryset.filter(piz__icontains=piz)
+    if start:
+        queryset = queryset.filter(examination_date__gte=start)
+    if end:
+        queryset = queryset.filter(examination_date__lte=end)
+    return queryset
 
 
 class EntryCreateView(LoginRequiredMixin, CreateView):
+    query_budget = 5
     model = StudyEntry
     form_class = StudyEntryForm
     template_name = "study/entry_form.html"
@@ -23,40 +66,51 @@ class EntryCreateView(LoginRequiredMixin, CreateView):
         form.instance.created_by = self.request.user
         form.instance.updated_by = self.request.user
         response = super().form_valid(form)
+        pin_to_primary(self.request)
         write_audit_event("entry_create", self.request.user.username, f"entry_id={self.object.id}")
         messages.success(self.request, "Entry created.")
         return response
 
 
 class EntryListView(LoginRequiredMixin, ListView):
+    query_budget = 4
     model = StudyEntry
     template_name = "study/entry_list.html"
     context_object_name = "entries"
     paginate_by = 50
 
+    @staticmethod
+    def admission_lane(request):
+        # A PIZ substring search scans the whole table unless a closed date range
+        # bounds it. The plain list is the landing page and is never shed.
+        if not request.GET.get("piz", "").strip():
+            return None
+        if request.GET.get("start_date", "").strip() and request.GET.get("end_date", "").strip():
+            return None
+        return "search"
+
     def get_queryset(self):
-        queryset = StudyEntry.objects.select_related("created_by", "updated_by").all()
-        piz = self.request.GET.get("piz", "").strip()
-        start = self.request.GET.get("start_date", "").strip()
-        end = self.request.GET.get("end_date", "").strip()
-        if piz:
-            queryset = queryset.filter(piz__icontains=piz)
-        if start:
-            queryset = queryset.filter(examination_date__gte=start)
-        if end:
-            queryset = queryset.filter(examination_date__lte=end)
-        return queryset
+        queryset = StudyEntry.objects.using(read_alias(self.request)).select_related(
+            "created_by", "updated_by"
+        )
+        return filter_entries(queryset, self.request.GET)
 
 
 class EntryUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
+    query_budget = 6
     model = StudyEntry
     form_class = StudyEntryForm
     template_name = "study/entry_form.html"
     success_url = reverse_lazy("entry-list")
 
+    def get_object(self, queryset=None):
+        # test_func and UpdateView.get/post both ask for the entry; fetch it once.
+        if not hasattr(self, "_entry"):
+            self._entry = super().get_object(queryset)
+        return self._entry
+
     def test_func(self):
-        entry = self.get_object()
-        return self.request.user.is_staff or entry.created_by_id == self.request.user.id
+        return can_edit_entry(self.request.user, self.get_object())
 
     def handle_no_permission(self):
         return HttpResponseForbidden("You are not allowed to edit this entry.")
@@ -64,15 +118,73 @@ class EntryUpdateView(LoginRequiredMixin, UserPassesTestMixin, UpdateView):
     def form_valid(self, form):
         form.instance.updated_by = self.request.user
         response = super().form_valid(form)
+        pin_to_primary(self.request)
         write_audit_event("entry_update", self.request.user.username, f"entry_id={self.object.id}")
         messages.success(self.request, "Entry updated.")
         return response
 
 
+class EntryBulkEditView(LoginRequiredMixin, FormView):
+    query_budget = 8
+    form_class = EntryBulkEditForm
+    template_name = "study/entry_bulk_edit.html"
+
+    def get_selection(self):
+        # Filters always come from the query string, on the preview and on the apply POST.
+        return editable_entries(
+            self.request.user, filter_entries(StudyEntry.objects.all(), self.request.GET)
+        )
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["user"] = self.request.user
+        return kwargs
+
+    def get(self, request, *args, **kwargs):
+        self.selection_count = self.get_selection().count()
+        self.initial = {"expected_count": self.selection_count}
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        form = context["form"]
+        context["selection_count"] = getattr(
+            self, "selection_count", form["expected_count"].value()
+        )
+        context["filters"] = {
+            key: self.request.GET.get(key, "").strip()
+            for key in ("piz", "start_date", "end_date")
+        }
+        context["list_url"] = f"{reverse('entry-list')}?{self.request.GET.urlencode()}"
+        return context
+
+    def form_valid(self, form):
+        try:
+            entry_ids = bulk_update_entries(
+                self.get_selection(),
+                form.changes(),
+                self.request.user,
+                form.cleaned_data["expected_count"],
+            )
+        except BulkEditConflictError as exc:
+            # Re-arm the form with the fresh count so the user can confirm the new preview.
+            self.selection_count = self.get_selection().count()
+            form.data = form.data.copy()
+            form.data["expected_count"] = self.selection_count
+            form.add_error(None, str(exc))
+            return self.form_invalid(form)
+
+        pin_to_primary(self.request)
+        messages.success(self.request, f"Updated {len(entry_ids)} entries.")
+        return redirect(f"{reverse('entry-list')}?{self.request.GET.urlencode()}")
+
+
+@query_budget(4)
+@admission_lane("heavy")
 @login_required
 def export_excel_view(request):
     try:
-        output_path = export_entries_to_excel()
+        output_path = export_entries_to_excel(using=read_alias(request))
     except ExportLockError as exc:
         messages.error(request, str(exc))
         return redirect("entry-list")
@@ -87,13 +199,90 @@ def export_excel_view(request):
     return response
 
 
+@query_budget(2)
+@login_required
+def export_status_view(request):
+    return JsonResponse(get_export_replication_status())
+
+
+class DataQualityView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    query_budget = 4
+    admission_lane = "heavy"
+    template_name = "study/data_quality.html"
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        report = build_quality_report(using=read_alias(self.request))
+        context["report"] = report
+        context["measurement_checks"] = [
+            ("Implausible LSM/CAP measurements", report["implausible_measurements"]),
+            ("LSM outliers within their month", report["lsm_monthly_outliers"]),
+            ("CAP outliers within their month", report["cap_monthly_outliers"]),
+        ]
+        return context
+
+
+class ProfileListView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    query_budget = 2
+    template_name = "study/profile_list.html"
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["profiles"] = list_profiles(settings.PROFILE_DIR)
+        return context
+
+
+class ProfileDetailView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    query_budget = 2
+    template_name = "study/profile_detail.html"
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        try:
+            profile = load_profile(settings.PROFILE_DIR, self.kwargs["profile_id"])
+        except ProfileNotFoundError as exc:
+            raise Http404("Profile not found") from exc
+        context["profile"] = profile
+        context["top_functions"] = top_functions(profile)
+        context["sql_total_ms"] = round(sum(query["duration_ms"] for query in profile["sql"]), 3)
+        return context
+
+
+@query_budget(2)
+@login_required
+def profile_download_view(request, profile_id):
+    if not request.user.is_staff:
+        return HttpResponseForbidden("Staff only.")
+    try:
+        profile = load_profile(settings.PROFILE_DIR, profile_id)
+    except ProfileNotFoundError as exc:
+        raise Http404("Profile not found") from exc
+    response = HttpResponse(folded_stacks(profile), content_type="text/plain; charset=utf-8")
+    response["Content-Disposition"] = f'attachment; filename="{profile_id}.folded"'
+    return response
+
+
 class InstructionListView(LoginRequiredMixin, ListView):
+    query_budget = 3
     model = StudyInstruction
     template_name = "study/instruction_list.html"
     context_object_name = "instructions"
 
+    def get_queryset(self):
+        return StudyInstruction.objects.select_related("uploaded_by")
+
 
 class InstructionUploadView(LoginRequiredMixin, UserPassesTestMixin, CreateView):
+    query_budget = 5
     model = StudyInstruction
     form_class = StudyInstructionForm
     template_name = "study/instruction_upload.html"
@@ -112,6 +301,7 @@ class InstructionUploadView(LoginRequiredMixin, UserPassesTestMixin, CreateView)
         return response
 
 
+@query_budget(3)
 @login_required
 def instruction_download_view(request, pk):
     instruction = get_object_or_404(StudyInstruction, pk=pk)
@@ -119,3 +309,37 @@ def instruction_download_view(request, pk):
         raise Http404("File missing")
     safe_filename = Path(instruction.pdf.name).name
     return FileResponse(instruction.pdf.open("rb"), as_attachment=True, filename=safe_filename)
+
+
+@query_budget(10)
+@csrf_exempt
+@require_POST
+def api_entry_batch_view(request):
+    # Token auth only: browsers never attach the header on their own, so no CSRF check.
+    user = user_for_api_token(request.headers.get("Authorization", ""))
+    if user is None:
+        return JsonResponse({"error": "Valid API token required."}, status=401)
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": "Request body must be JSON."}, status=400)
+    items = payload.get("entries") if isinstance(payload, dict) else None
+    if not isinstance(items, list):
+        return JsonResponse({"error": "Expected an object with an 'entries' list."}, status=400)
+    if len(items) > settings.API_MAX_BATCH_SIZE:
+        return JsonResponse(
+            {"error": f"At most {settings.API_MAX_BATCH_SIZE} entries per batch."}, status=413
+        )
+
+    idempotency_key = request.headers.get("Idempotency-Key", "").strip()
+    if len(idempotency_key) > 128:
+        return JsonResponse({"error": "Idempotency-Key is longer than 128 characters."}, status=400)
+
+    try:
+        result = ingest_entries(
+            items, user, idempotency_key, hashlib.sha256(request.body).hexdigest()
+        )
+    except IngestConflictError as exc:
+        return JsonResponse({"error": str(exc)}, status=422)
+    return JsonResponse(result)
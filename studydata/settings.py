@@ -6,6 +6,7 @@ import json
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -31,6 +32,43 @@ def _as_list(value: object, default: list[str] | None = None) -> list[str]:
     return [item.strip() for item in str(value).split(",") if item.strip()]
 
 
+def _private_directory(path: Path) -> Path:
+    """Create ``path`` with mode 0700, refusing a directory another user owns."""
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    if hasattr(os, "getuid"):
+        if path.stat().st_uid != os.getuid():
+            raise ImproperlyConfigured(f"{path} must be owned by the user running the app.")
+        os.chmod(path, 0o700)
+    return path
+
+
+def _admission_lanes(value: object) -> dict[str, dict]:
+    """Parse ADMISSION_LANES (JSON when it comes from the environment) and check every lane."""
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError as exc:
+            raise ImproperlyConfigured(f"ADMISSION_LANES is not valid JSON: {exc}") from exc
+    if not isinstance(value, dict):
+        raise ImproperlyConfigured("ADMISSION_LANES must map lane names to their limits.")
+    missing_lanes = {"heavy", "search"} - value.keys()
+    if missing_lanes:
+        raise ImproperlyConfigured(f"ADMISSION_LANES lacks the lanes {', '.join(sorted(missing_lanes))}.")
+    required = {"slots", "rate", "per_seconds", "retry_after"}
+    for lane, config in value.items():
+        if not isinstance(config, dict) or not required <= config.keys():
+            raise ImproperlyConfigured(
+                f"ADMISSION_LANES[{lane!r}] needs {', '.join(sorted(required))}."
+            )
+        if not isinstance(config["slots"], int) or not all(
+            isinstance(config[key], (int, float)) and config[key] > 0 for key in required
+        ):
+            raise ImproperlyConfigured(
+                f"ADMISSION_LANES[{lane!r}] limits must be positive numbers (slots an integer)."
+            )
+    return value
+
+
 config_data: dict[str, object] = {}
 if CONFIG_PATH.exists():
     with CONFIG_PATH.open("r", encoding="utf-8") as config_file:
@@ -64,7 +102,10 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
+    "study.middleware.AdmissionControlMiddleware",
+    "study.middleware.ProfilingMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "study.middleware.QueryInspectionMiddleware",
 ]
 
 ROOT_URLCONF = "studydata.urls"
@@ -87,27 +128,32 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "studydata.wsgi.application"
 
-DATABASE_URL = str(get_config("DATABASE_URL", "")).strip()
-if DATABASE_URL.startswith("postgres://"):
-    DATABASE_URL = "postgresql://" + DATABASE_URL[len("postgres://"):]
-
-if DATABASE_URL:
+def _postgres_database(url: str, connect_timeout: int | None = None) -> dict[str, object]:
     from urllib.parse import urlparse
 
-    parsed = urlparse(DATABASE_URL)
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    parsed = urlparse(url)
     if parsed.scheme not in {"postgres", "postgresql"}:
-        raise ValueError("Only PostgreSQL DATABASE_URL is supported when set.")
-
-    DATABASES = {
-        "default": {
-            "ENGINE": "django.db.backends.postgresql",
-            "NAME": parsed.path.lstrip("/"),
-            "USER": parsed.username or "",
-            "PASSWORD": parsed.password or "",
-            "HOST": parsed.hostname or "",
-            "PORT": str(parsed.port or ""),
-        }
+        raise ValueError("Only PostgreSQL database URLs are supported when set.")
+
+    database: dict[str, object] = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": parsed.path.lstrip("/"),
+        "USER": parsed.username or "",
+        "PASSWORD": parsed.password or "",
+        "HOST": parsed.hostname or "",
+        "PORT": str(parsed.port or ""),
     }
+    if connect_timeout is not None:
+        database["OPTIONS"] = {"connect_timeout": connect_timeout}
+    return database
+
+
+DATABASE_URL = str(get_config("DATABASE_URL", "")).strip()
+
+if DATABASE_URL:
+    DATABASES = {"default": _postgres_database(DATABASE_URL)}
 else:
     DATABASES = {
         "default": {
@@ -116,6 +162,26 @@ else:
         }
     }
 
+# Read replicas: PostgreSQL URLs, or SQLite file paths for local testing.
+# They become the aliases replica_1, replica_2, ... and only serve the
+# read-heavy workloads that ask for them via study.db_router.read_alias().
+# Health checks connect during a request, so an unreachable replica host only
+# delays it by REPLICA_CONNECT_TIMEOUT_SECONDS.
+DATABASE_REPLICAS = _as_list(get_config("DATABASE_REPLICAS", []))
+REPLICA_CONNECT_TIMEOUT_SECONDS = int(get_config("REPLICA_CONNECT_TIMEOUT_SECONDS", 3))
+for replica_index, replica in enumerate(DATABASE_REPLICAS, start=1):
+    if "://" in replica:
+        replica_config = _postgres_database(replica, connect_timeout=REPLICA_CONNECT_TIMEOUT_SECONDS)
+    else:
+        replica_config = {"ENGINE": "django.db.backends.sqlite3", "NAME": replica}
+    replica_config["TEST"] = {"MIRROR": "default"}
+    DATABASES[f"replica_{replica_index}"] = replica_config
+
+DATABASE_ROUTERS = ["study.db_router.ReadReplicaRouter"]
+REPLICA_STICKINESS_SECONDS = float(get_config("REPLICA_STICKINESS_SECONDS", 30))
+REPLICA_MAX_LAG_SECONDS = float(get_config("REPLICA_MAX_LAG_SECONDS", 60))
+REPLICA_HEALTH_CHECK_SECONDS = float(get_config("REPLICA_HEALTH_CHECK_SECONDS", 10))
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -140,19 +206,93 @@ MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
 
 DATA_XLSX_PATH = str(get_config("DATA_XLSX_PATH", BASE_DIR / "instance" / "study_export.xlsx"))
 
+# When set, exports are built on this local directory and replicated to
+# DATA_XLSX_PATH in the background instead of being written on the share.
+EXPORT_STAGING_DIR = str(get_config("EXPORT_STAGING_DIR", "")).strip()
+EXPORT_REPLICATION_RETRIES = int(get_config("EXPORT_REPLICATION_RETRIES", 5))
+EXPORT_REPLICATION_BACKOFF_SECONDS = float(get_config("EXPORT_REPLICATION_BACKOFF_SECONDS", 2.0))
+# When set, every export is also recorded in this deduplicated snapshot store.
+EXPORT_SNAPSHOT_DIR = str(get_config("EXPORT_SNAPSHOT_DIR", "")).strip()
+
+# Identical SQL issued this many times within one request is logged as a
+# likely N+1 pattern (only while DEBUG is on).
+QUERY_REPEAT_THRESHOLD = int(get_config("QUERY_REPEAT_THRESHOLD", 3))
+
+# Cached session/auth mode: sessions are read from the cache (written through to
+# the database), flash messages live in a cookie, and each worker caches users
+# for AUTH_USER_CACHE_SECONDS. User saves/deletes touch a marker file in
+# AUTH_CACHE_DIR so every worker on the host drops its copy.
+# The session cache must be shared by all workers, otherwise a logout in one
+# worker leaves the session alive in the others; it is a file-based cache in
+# SESSION_CACHE_DIR on local disk. The cache unpickles whatever it finds, so both
+# directories must be private to the app user (see _private_directory).
+CACHED_AUTH = _as_bool(get_config("CACHED_AUTH", False))
+AUTH_USER_CACHE_SECONDS = float(get_config("AUTH_USER_CACHE_SECONDS", 30))
+AUTH_CACHE_DIR = Path(str(get_config("AUTH_CACHE_DIR", INSTANCE_DIR / "auth-cache")))
+SESSION_CACHE_DIR = Path(str(get_config("SESSION_CACHE_DIR", AUTH_CACHE_DIR / "sessions")))
+if CACHED_AUTH:
+    _private_directory(AUTH_CACHE_DIR)
+    _private_directory(SESSION_CACHE_DIR)
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "sessions": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": SESSION_CACHE_DIR,
+            "OPTIONS": {"MAX_ENTRIES": 10000},
+        },
+    }
+    SESSION_CACHE_ALIAS = "sessions"
+    SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+    MESSAGE_STORAGE = "django.contrib.messages.storage.cookie.CookieStorage"
+    AUTHENTICATION_BACKENDS = ["study.auth_backends.CachedModelBackend"]
+
+# Admission control for expensive views (disabled while ADMISSION_CONTROL_DIR is
+# empty). The directory must be on local disk: it holds the lane slot lock files
+# and the per-user rate counters shared by all workers. Per lane: concurrent
+# "slots" across all workers, "rate" requests per user per "per_seconds", and
+# the Retry-After hint in seconds when every slot is busy. The slots of all
+# lanes together must stay below the number of gunicorn workers, so at least one
+# worker is always free for cheap pages (the defaults use 2 of 3).
+ADMISSION_CONTROL_DIR = str(get_config("ADMISSION_CONTROL_DIR", "")).strip()
+ADMISSION_LANES = get_config(
+    "ADMISSION_LANES",
+    {
+        "heavy": {"slots": 1, "rate": 6, "per_seconds": 60, "retry_after": 10},
+        "search": {"slots": 1, "rate": 60, "per_seconds": 60, "retry_after": 2},
+    },
+)
+ADMISSION_LANES = _admission_lanes(ADMISSION_LANES)
+
+# Request profiling: staff trigger it per request with an "X-Profile: 1" header or
+# "?_profile=1"; PROFILE_SAMPLE_RATE additionally profiles that fraction of all
+# requests. Only the newest PROFILE_MAX_FILES profiles are kept.
+PROFILING_ENABLED = _as_bool(get_config("PROFILING_ENABLED", True), True)
+PROFILE_SAMPLE_RATE = float(get_config("PROFILE_SAMPLE_RATE", 0))
+PROFILE_SAMPLE_INTERVAL_MS = float(get_config("PROFILE_SAMPLE_INTERVAL_MS", 2))
+PROFILE_MAX_FILES = int(get_config("PROFILE_MAX_FILES", 200))
+PROFILE_DIR = LOG_DIR / "profiles"
+
+API_MAX_BATCH_SIZE = int(get_config("API_MAX_BATCH_SIZE", 1000))
+
 LOGIN_URL = "login"
 LOGIN_REDIRECT_URL = "entry-list"
 LOGOUT_REDIRECT_URL = "login"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# study.audit is written as JSON lines into one file per segment; closed
+# segments are gzipped and summarized in AUDIT_LOG_DIR/index.json.
+AUDIT_LOG_DIR = LOG_DIR / "audit"
+AUDIT_SEGMENT_SECONDS = int(get_config("AUDIT_SEGMENT_SECONDS", 86400))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "handlers": {
         "audit_file": {
-            "class": "logging.FileHandler",
-            "filename": LOG_DIR / "audit.log",
+            "class": "study.audit_log.SegmentedAuditFileHandler",
+            "directory": AUDIT_LOG_DIR,
+            "segment_seconds": AUDIT_SEGMENT_SECONDS,
         },
         "console": {
             "class": "logging.StreamHandler",
@@ -163,6 +303,11 @@ LOGGING = {
             "handlers": ["audit_file", "console"],
             "level": "INFO",
             "propagate": False,
-        }
+        },
+        "study.queries": {
+            "handlers": ["console"],
+            "level": "WARNING",
+            "propagate": False,
+        },
     },
 }